@@ -4,13 +4,23 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
+from sqlalchemy.engine import make_url
 from models import GeoLocation
 from database import Base
+from settings import settings
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
+# migrations run synchronously, so async sqlite driver is swapped for default one
+url = make_url(settings.database_url)
+if url.drivername == "sqlite+aiosqlite":
+    url = url.set(drivername="sqlite")
+config.set_main_option(
+    "sqlalchemy.url", url.render_as_string(hide_password=False).replace("%", "%%")
+)
+
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 if config.config_file_name is not None:
@@ -0,0 +1,48 @@
+"""add storage dictionary
+
+Revision ID: 01fae710328b
+Revises: 5adbe0f735a5
+Create Date: 2026-10-18 03:53:13.822232
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "01fae710328b"
+down_revision: Union[str, Sequence[str], None] = "5adbe0f735a5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "storage_dictionary",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("codec", sa.String(length=8), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # documents are rewritten by manage.py recompress, which knows the codecs;
+    # compressed ones cannot be read back once their dictionaries are gone
+    compressed = op.get_bind().scalar(
+        sa.text(
+            "SELECT count(*) FROM geo_location"
+            " WHERE typeof(ipstack_response) = 'blob'"
+        )
+    )
+    if compressed:
+        raise RuntimeError(
+            f"{compressed} documents are compressed, store them as text with"
+            " `STORAGE_CODEC=none python manage.py recompress` first"
+        )
+    op.drop_table("storage_dictionary")
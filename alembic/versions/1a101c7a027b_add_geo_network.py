@@ -0,0 +1,37 @@
+"""add geo network
+
+Revision ID: 1a101c7a027b
+Revises: e9e0233bea69
+Create Date: 2026-10-18 03:13:49.236165
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "1a101c7a027b"
+down_revision: Union[str, Sequence[str], None] = "e9e0233bea69"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "geo_network",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("network", sa.LargeBinary(), nullable=False),
+        sa.Column("prefix_length", sa.SmallInteger(), nullable=False),
+        sa.Column("family", sa.SmallInteger(), nullable=False),
+        sa.Column("ipstack_response", sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("network", "prefix_length"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("geo_network")
@@ -0,0 +1,38 @@
+"""add fetched at to geo location
+
+Revision ID: 5adbe0f735a5
+Revises: 73a99b5a30d3
+Create Date: 2026-10-18 03:28:10.978662
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5adbe0f735a5"
+down_revision: Union[str, Sequence[str], None] = "73a99b5a30d3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.add_column(sa.Column("fetched_at", sa.DateTime(), nullable=True))
+
+    # stored documents were fetched when they were last written
+    op.execute("UPDATE geo_location SET fetched_at = updated_at")
+
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.alter_column("fetched_at", existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index("ix_geo_location_fetched_at", ["fetched_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.drop_index("ix_geo_location_fetched_at")
+        batch_op.drop_column("fetched_at")
@@ -0,0 +1,59 @@
+"""add etag and version to geo location
+
+Revision ID: 73a99b5a30d3
+Revises: 1a101c7a027b
+Create Date: 2026-10-18 03:21:35.629802
+
+"""
+
+from typing import Sequence, Union
+
+import hashlib
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "73a99b5a30d3"
+down_revision: Union[str, Sequence[str], None] = "1a101c7a027b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.add_column(sa.Column("etag", sa.String(32), nullable=True))
+        batch_op.add_column(
+            sa.Column("version", sa.Integer(), nullable=False, server_default="1")
+        )
+        batch_op.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+
+    # etag is a hash of the stored text, which is what GET /geo sends
+    connection = op.get_bind()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = connection.execute(
+        sa.text("SELECT id, ipstack_response FROM geo_location")
+    ).all()
+    for id, document in rows:
+        etag = hashlib.blake2b((document or "null").encode(), digest_size=16)
+        connection.execute(
+            sa.text(
+                "UPDATE geo_location SET etag = :etag, updated_at = :updated_at "
+                "WHERE id = :id"
+            ),
+            {"etag": etag.hexdigest(), "updated_at": now, "id": id},
+        )
+
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.alter_column("etag", existing_type=sa.String(32), nullable=False)
+        batch_op.alter_column("updated_at", existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.drop_column("updated_at")
+        batch_op.drop_column("version")
+        batch_op.drop_column("etag")
@@ -0,0 +1,79 @@
+"""store ip as packed binary
+
+Revision ID: e9e0233bea69
+Revises: c91f0758b9af
+Create Date: 2026-10-18 03:12:26.673219
+
+"""
+
+from ipaddress import IPv6Address, ip_address
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e9e0233bea69"
+down_revision: Union[str, Sequence[str], None] = "c91f0758b9af"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _canonical_ip(value):
+    address = ip_address(value)
+    if isinstance(address, IPv6Address) and address.ipv4_mapped:
+        return address.ipv4_mapped
+    return address
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    # read before table is rebuilt, as that casts text to blob
+    rows = conn.execute(sa.text("SELECT id, ip FROM geo_location ORDER BY id")).all()
+
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.drop_index("ix_geo_location_ip")
+        batch_op.alter_column("ip", existing_type=sa.String(), type_=sa.LargeBinary())
+        batch_op.add_column(sa.Column("family", sa.SmallInteger(), nullable=True))
+
+    seen = set()
+    for row_id, ip in rows:
+        address = _canonical_ip(ip)
+        if address.packed in seen:
+            # another textual form of already stored address, oldest row wins
+            conn.execute(
+                sa.text("DELETE FROM geo_location WHERE id = :id"), {"id": row_id}
+            )
+            continue
+        seen.add(address.packed)
+        conn.execute(
+            sa.text(
+                "UPDATE geo_location SET ip = :ip, family = :family WHERE id = :id"
+            ),
+            {"ip": address.packed, "family": address.version, "id": row_id},
+        )
+
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.alter_column("family", existing_type=sa.SmallInteger(), nullable=False)
+        batch_op.create_index("ix_geo_location_ip", ["ip"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, ip FROM geo_location")).all()
+
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.drop_index("ix_geo_location_ip")
+        batch_op.drop_column("family")
+        batch_op.alter_column("ip", existing_type=sa.LargeBinary(), type_=sa.String())
+
+    for row_id, ip in rows:
+        conn.execute(
+            sa.text("UPDATE geo_location SET ip = :ip WHERE id = :id"),
+            {"ip": str(ip_address(ip)), "id": row_id},
+        )
+
+    with op.batch_alter_table("geo_location") as batch_op:
+        batch_op.create_index("ix_geo_location_ip", ["ip"], unique=True)
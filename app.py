@@ -1,18 +1,127 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+import asyncio
+import math
+import zlib
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Literal
+from email.utils import format_datetime
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import String, case, delete, func, select, type_coerce
+from sqlalchemy.dialects.sqlite import insert
 
 from settings import settings
-from utils import Locator, IPAddress, get_db, get_locator, setup_logger
-from models import GeoLocation
-from pydantic import BaseModel
-from sqlalchemy.exc import SQLAlchemyError
+from storage_codec import storage_codec
+from database import (
+    SessionMaker,
+    RawJSON,
+    canonical_ip,
+    dumps_json,
+    engine,
+    loads_json,
+    read_engine,
+    warm_pool,
+)
+from utils import (
+    Locator,
+    IPAddress,
+    SingleFlight,
+    get_db,
+    get_read_db,
+    get_locator,
+    setup_logger,
+    FieldSelection,
+    GeoDocument,
+    geo_cache,
+    load_hot_ips,
+    save_hot_ips,
+    network_index,
+    registry,
+    snapshot_store,
+    timed,
+    MetricsMiddleware,
+    RateLimitMiddleware,
+    read_limiter,
+    write_limiter,
+    TimedJSONResponse,
+    UpstreamUnavailable,
+)
+from utils.group_commit import group_commit
+from utils.ipstack_client import ipstack_client
+from utils.refresher import refresher
+from utils.startup import startup
+from models import GeoLocation, GeoNetwork, StorageDictionary, document_etag, utcnow
+from pydantic import BaseModel, Field, IPvAnyNetwork
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 import logging
 
-setup_logger()
 logger = logging.getLogger(settings.logger_name)
-app = FastAPI(title="Geo Location API")
+# hot ips are read from the database in chunks of this size on startup
+PRELOAD_CHUNK = 500
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    setup_logger()
+    # requests are accepted once this is done, so readiness means warm
+    if settings.snapshot_mode != "only":
+        with startup.phase("database"):
+            await warm_pool(engine, settings.database_pool_size)
+            if read_engine is not engine:
+                await warm_pool(read_engine, settings.database_read_pool_size)
+        async with SessionMaker() as db:
+            with startup.phase("dictionaries"):
+                await load_dictionaries(db)
+            with startup.phase("networks"):
+                network_keys = await load_networks(db)
+            if settings.cache_warm_path:
+                with startup.phase("cache"):
+                    await preload_cache(db)
+    tasks = []
+    if settings.snapshot_mode != "off":
+        with startup.phase("snapshot"):
+            snapshot_store.reload()
+        tasks.append(
+            asyncio.create_task(snapshot_store.watch(settings.snapshot_poll_interval))
+        )
+    if settings.snapshot_mode != "only" and settings.network_reload_interval > 0:
+        tasks.append(
+            asyncio.create_task(
+                watch_networks(settings.network_reload_interval, network_keys)
+            )
+        )
+    # refresh runs next to requests, never inside of them
+    if settings.refresh_enabled:
+        tasks.append(asyncio.create_task(refresher.run()))
+    startup.done()
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # workers without local entries (shared cache) keep the saved list
+    if settings.cache_warm_path and (
+        hot_ips := geo_cache.recent_ips(settings.cache_warm_size)
+    ):
+        save_hot_ips(settings.cache_warm_path, hot_ips)
+    await ipstack_client.close()
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
+app = FastAPI(
+    title="Geo Location API",
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
+)
+# added first, so rejected requests are still measured by MetricsMiddleware
+app.add_middleware(RateLimitMiddleware, read=read_limiter, write=write_limiter)
+app.add_middleware(MetricsMiddleware)
+# concurrent POSTs of one ip share single ipstack call and insert
+post_flight = SingleFlight()
 
 
 class PostLocation(BaseModel):
@@ -20,6 +129,22 @@ class PostLocation(BaseModel):
     url: str | None = None
 
 
+class PostNetwork(BaseModel):
+    network: IPvAnyNetwork
+    # address looked up for the whole network, network address by default
+    ip: IPAddress | None = None
+
+
+class LookupLocations(BaseModel):
+    ips: list[IPAddress] = Field(default_factory=list)
+    urls: list[str] = Field(default_factory=list)
+
+
+class DeleteLocations(LookupLocations):
+    # every stored address of the network, instead of ips/urls
+    network: IPvAnyNetwork | None = None
+
+
 @app.exception_handler(SQLAlchemyError)
 def handle_database_errors(_: Request, __: SQLAlchemyError):
     logger.error("Database connection error", exc_info=True)
@@ -27,6 +152,17 @@ def handle_database_errors(_: Request, __: SQLAlchemyError):
     return JSONResponse({"message": "Unexpected error occurred, try again later."}, 500)
 
 
+@app.exception_handler(UpstreamUnavailable)
+def handle_upstream_unavailable(_: Request, exc: UpstreamUnavailable):
+    logger.warning("Ipstack unavailable: %s", exc)
+    headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    return JSONResponse(
+        {"message": "Location service is unavailable, try again later."},
+        503,
+        headers=headers,
+    )
+
+
 @app.exception_handler(HTTPException)
 def handle_general_errors(_: Request, exc: HTTPException):
     # every response should be in JSON format
@@ -43,18 +179,102 @@ def handle_general_errors(_: Request, __: Exception):
 async def get_geo(
     ip: IPAddress | None = None,
     url: str = None,
-    db: AsyncSession = Depends(get_db),
+    fields: str | None = None,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
     locator: Locator = Depends(get_locator),
 ):
     _raise_if_ip_and_url_not_exclusive(ip, url)
+    selection = _parse_fields(fields) if fields is not None else None
 
     ip = await locator.resolve_to_ip(ip or url)
     if ip is None:
         raise HTTPException(400, "Could not resolve URL to IP")
-    geo_location = await pull_geo_location_by(ip, db)
-    if not geo_location:
+
+    headers = {}
+    projected = False
+    document = pull_snapshot_document(ip)
+    if document is None and settings.snapshot_mode != "only":
+        document = geo_cache.get(ip)
+        if document is None and if_none_match:
+            # validators only, so revalidation does not load the document
+            validators = await pull_validators_by(ip, db)
+            if validators:
+                validators = (_selection_etag(validators[0], selection), validators[1])
+            if validators and _etag_matches(if_none_match, validators[0]):
+                return Response(status_code=304, headers=_cache_headers(*validators))
+        if document is None and selection is not None:
+            # fields are picked by the database, full document is not read
+            document = await pull_projection_by(ip, selection, db)
+            projected = document is not None
+        elif document is None:
+            document = await pull_document_from_db(ip, db)
+    if document is None and (match := network_index.lookup(ip)):
+        network, document = match
+        headers["X-Geo-Network"] = str(network)
+    if document is None:
         raise HTTPException(404, "Location for given ip/url not found")
-    return geo_location.ipstack_response
+    if selection is not None and not projected:
+        document = project_document(document, selection)
+
+    headers.update(_cache_headers(document.etag, document.modified_at))
+    if if_none_match and _etag_matches(if_none_match, document.etag):
+        return Response(status_code=304, headers=headers)
+    # stored document is sent as it is, without decoding and encoding it again
+    return Response(document.payload, media_type="application/json", headers=headers)
+
+
+@app.get("/geo/export")
+async def export_geo(
+    family: Literal["4", "6"] | None = None,
+    after: int = Query(0, ge=0),
+    accept_encoding: str = Header(""),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Stream stored geo locations as NDJSON, ordered by id.
+
+    Every line carries row id, so interrupted export is resumed with `after`.
+    """
+    compress = _accepts_gzip(accept_encoding)
+    # the same url is sent compressed or not, caches have to tell them apart
+    headers = {"Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        stream_export(db, family and int(family), after, compress),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+@app.post("/geo/lookup")
+async def lookup_geo(
+    locations: LookupLocations,
+    db: AsyncSession = Depends(get_read_db),
+    locator: Locator = Depends(get_locator),
+):
+    items = [*locations.ips, *locations.urls]
+    _raise_if_batch_size_invalid(len(items))
+
+    ips = await asyncio.gather(*[locator.resolve_to_ip(item) for item in items])
+    documents = await pull_documents_by({ip for ip in ips if ip}, db)
+
+    # per item statuses follow GET /geo, stored documents are embedded as they are
+    results = []
+    for item, ip in zip(items, ips):
+        if ip is None:
+            result = {"status": 400, "message": "Could not resolve URL to IP"}
+        elif ip in documents:
+            result = b'{"status":200,"data":' + documents[ip].payload + b"}"
+        elif match := network_index.lookup(ip):
+            result = b'{"status":200,"data":' + match[1].payload + b"}"
+        else:
+            result = {"status": 404, "message": "Location for given ip/url not found"}
+        if isinstance(result, dict):
+            result = encode_payload(result)
+        results.append(encode_payload(str(item)) + b":" + result)
+    content = b'{"results":{' + b",".join(results) + b"}}"
+    return Response(content, media_type="application/json")
 
 
 @app.post("/geo", status_code=201)
@@ -69,26 +289,81 @@ async def post_geo(
     if ip is None:
         raise HTTPException(400, "Could not resolve URL to IP")
 
-    geo_location = await pull_geo_location_by(ip, db)
-    if geo_location:
+    ipstack_response, shared = await post_flight.do(
+        ip, lambda: _create_geo_location(ip, db, locator)
+    )
+    if shared:
+        # location was created by request this one has joined
         raise HTTPException(409, "Geo location already exist")
+    return ipstack_response
 
-    ipstack_response = await locator.get_location_for(ip)
-    if not ipstack_response:
-        raise HTTPException(400, "Could not find data for given address")
 
-    geo_location = GeoLocation(ip=ip, ipstack_response=ipstack_response)
-    db.add(geo_location)
-    await db.commit()
-    await db.refresh(geo_location)
+@app.post("/geo/bulk")
+async def post_geo_bulk(
+    locations: list[PostLocation],
+    db: AsyncSession = Depends(get_db),
+    locator: Locator = Depends(get_locator),
+):
+    _raise_if_batch_size_invalid(len(locations))
 
-    return geo_location.ipstack_response
+    results, item_ips = {}, {}
+    for location in locations:
+        item = str(location.ip or location.url)
+        if message := _ip_and_url_exclusivity_error(location.ip, location.url):
+            results[item] = {"status": 400, "message": message}
+        else:
+            item_ips[item] = location.ip or location.url
+    ips = await asyncio.gather(*[locator.resolve_to_ip(v) for v in item_ips.values()])
+    item_ips = dict(zip(item_ips, ips))
+
+    resolved = {ip for ip in ips if ip}
+    existing = await pull_existing_ips(resolved, db)
+    ipstack_responses = await locator.get_locations_for(sorted(resolved - existing))
+
+    created = set()
+    documents = {
+        ip: encode_document(ipstack_response, utcnow())
+        for ip, ipstack_response in ipstack_responses.items()
+        if ipstack_response
+    }
+    rows = [
+        _location_row(ip, ipstack_responses[ip], document)
+        for ip, document in documents.items()
+    ]
+    if rows:
+        # single transaction, rows inserted concurrently by others are skipped
+        query = (
+            insert(GeoLocation)
+            .on_conflict_do_nothing(index_elements=[GeoLocation.ip])
+            .returning(GeoLocation.ip)
+        )
+        with timed("db"):
+            created = set((await db.execute(query, rows)).scalars())
+            await db.commit()
+
+    for item, ip in item_ips.items():
+        if ip is None:
+            results[item] = {"status": 400, "message": "Could not resolve URL to IP"}
+        elif ip in created:
+            # next items resolved to the same ip are reported as existing
+            created.discard(ip)
+            geo_cache.put(ip, documents[ip])
+            results[item] = {"status": 201, "data": ipstack_responses[ip]}
+        elif ip in existing or ipstack_responses.get(ip):
+            results[item] = {"status": 409, "message": "Geo location already exist"}
+        else:
+            results[item] = {
+                "status": 400,
+                "message": "Could not find data for given address",
+            }
+    return {"results": results}
 
 
 @app.delete("/geo", status_code=204)
 async def delete_geo(
     ip: IPAddress | None = None,
     url: str = None,
+    if_match: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
     locator: Locator = Depends(get_locator),
 ):
@@ -99,20 +374,477 @@ async def delete_geo(
     geo_location = await pull_geo_location_by(ip, db)
     if not geo_location:
         raise HTTPException(404, "Location for given ip/url not found")
+    if if_match and not _etag_matches(if_match, geo_location.etag, weak=False):
+        raise HTTPException(412, "Geo location was modified")
 
-    await db.delete(geo_location)
-    await db.commit()
+    try:
+        with timed("db"):
+            await db.delete(geo_location)
+            await db.commit()
+    except StaleDataError:
+        # row version changed since it was read
+        await db.rollback()
+        raise HTTPException(412, "Geo location was modified")
+    geo_cache.invalidate(ip)
     return
 
 
+@app.post("/geo/bulk-delete")
+async def bulk_delete_geo(
+    locations: DeleteLocations,
+    db: AsyncSession = Depends(get_db),
+    locator: Locator = Depends(get_locator),
+):
+    """Delete locations of given ips/urls or of a whole network in one statement."""
+    items = [*locations.ips, *locations.urls]
+    if locations.network is not None:
+        if items:
+            raise HTTPException(400, "Provide either ips/urls or network (not both)")
+        network = locations.network
+        # packed addresses of one family sort like the addresses themselves
+        condition = (GeoLocation.family == network.version) & GeoLocation.ip.between(
+            network.network_address, network.broadcast_address
+        )
+    else:
+        _raise_if_batch_size_invalid(len(items))
+        ips = await asyncio.gather(*[locator.resolve_to_ip(item) for item in items])
+        condition = GeoLocation.ip.in_({ip for ip in ips if ip})
+
+    query = (
+        delete(GeoLocation)
+        .where(condition)
+        .returning(GeoLocation.ip)
+        .execution_options(synchronize_session=False)
+    )
+    with timed("db"):
+        deleted = list((await db.execute(query)).scalars())
+        await db.commit()
+    geo_cache.invalidate_many(deleted)
+    return {"deleted": len(deleted)}
+
+
+@app.post("/geo/network", status_code=201)
+async def post_geo_network(
+    location: PostNetwork,
+    db: AsyncSession = Depends(get_db),
+    locator: Locator = Depends(get_locator),
+):
+    network = location.network
+    address = canonical_ip(location.ip or network.network_address)
+    if address not in network:
+        raise HTTPException(400, "Ip has to belong to the network")
+    if await pull_geo_network_by(network, db):
+        raise HTTPException(409, "Geo network already exist")
+
+    ip = str(address)
+    # stored location of the address is reused, snapshot may be out of date
+    if document := (await pull_documents_from_db({ip}, db)).get(ip):
+        ipstack_response = loads_json(document.payload)
+    else:
+        ipstack_response = await locator.get_location_for(ip)
+    if not ipstack_response:
+        raise HTTPException(400, "Could not find data for given address")
+
+    geo_network = GeoNetwork(
+        network=str(network.network_address),
+        prefix_length=network.prefixlen,
+        ipstack_response=ipstack_response,
+    )
+    db.add(geo_network)
+    try:
+        with timed("db"):
+            await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(409, "Geo network already exist")
+    network_index.insert(network, encode_document(ipstack_response))
+
+    return ipstack_response
+
+
+@app.delete("/geo/network", status_code=204)
+async def delete_geo_network(
+    network: IPvAnyNetwork,
+    db: AsyncSession = Depends(get_db),
+):
+    geo_network = await pull_geo_network_by(network, db)
+    if not geo_network:
+        raise HTTPException(404, "Geo network not found")
+
+    with timed("db"):
+        await db.delete(geo_network)
+        await db.commit()
+    network_index.remove(network)
+    return
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return geo_cache.stats()
+
+
+@app.get("/ready")
+async def get_ready():
+    if not startup.ready:
+        raise HTTPException(503, "Application is starting")
+    return {"startup_seconds": startup.seconds, "phases": startup.phases}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return registry.render()
+
+
+async def load_dictionaries(db: AsyncSession):
+    """Register storage dictionaries, so documents compressed with them can be read."""
+    query = select(
+        StorageDictionary.id, StorageDictionary.codec, StorageDictionary.data
+    )
+    with timed("db"):
+        result = await db.execute(query)
+    storage_codec.load(result.all())
+    # misconfigured codec fails the startup, not the writes
+    storage_codec.check()
+
+
+async def load_networks(db: AsyncSession, known: frozenset = frozenset()) -> frozenset:
+    """Rebuild network index when stored networks are not the known ones.
+
+    Returns keys of stored networks, compared on the next call.
+    """
+    query = select(GeoNetwork.id, GeoNetwork.network, GeoNetwork.prefix_length)
+    with timed("db"):
+        keys = frozenset((await db.execute(query)).all())
+    if keys != known:
+        network_index.replace(
+            (geo_network.cidr, encode_document(geo_network.ipstack_response))
+            for geo_network in await pull_geo_networks(db)
+        )
+    return keys
+
+
+async def watch_networks(interval: float, known: frozenset):
+    # index of this worker is updated by its own writes right away,
+    # writes of other workers are picked up here
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with SessionMaker() as db:
+                known = await load_networks(db, known)
+        except Exception:
+            logger.exception("Reloading geo networks failed")
+
+
+async def preload_cache(db: AsyncSession) -> int:
+    """Load documents of ips saved at the last shutdown into the cache."""
+    ips = load_hot_ips(settings.cache_warm_path, settings.cache_warm_size)
+    documents = {}
+    for start in range(0, len(ips), PRELOAD_CHUNK):
+        chunk = set(ips[start : start + PRELOAD_CHUNK])
+        documents.update(await pull_documents_from_db(chunk, db))
+    # hottest are put last, so they are evicted last
+    for ip in reversed(ips):
+        if ip in documents:
+            geo_cache.put(ip, documents[ip])
+    logger.info("Preloaded %d of %d hot locations", len(documents), len(ips))
+    return len(documents)
+
+
 async def pull_geo_location_by(ip: IPAddress | str, db: AsyncSession) -> GeoLocation:
     query = select(GeoLocation).where(GeoLocation.ip == ip)
-    result = await db.execute(query)
+    with timed("db"):
+        result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def pull_geo_network_by(network: IPvAnyNetwork, db: AsyncSession) -> GeoNetwork:
+    query = select(GeoNetwork).where(
+        GeoNetwork.network == network.network_address,
+        GeoNetwork.prefix_length == network.prefixlen,
+    )
+    with timed("db"):
+        result = await db.execute(query)
     return result.scalars().first()
 
 
+async def pull_geo_networks(db: AsyncSession) -> list[GeoNetwork]:
+    with timed("db"):
+        result = await db.execute(select(GeoNetwork))
+    return list(result.scalars())
+
+
+async def pull_existing_ips(ips: set[str], db: AsyncSession) -> set[str]:
+    if not ips:
+        return set()
+    query = select(GeoLocation.ip).where(GeoLocation.ip.in_(ips))
+    with timed("db"):
+        result = await db.execute(query)
+    return set(result.scalars())
+
+
+async def pull_document_from_db(ip: str, db: AsyncSession) -> GeoDocument | None:
+    """Read stored document missing in the cache and put it there."""
+    document = (await pull_documents_from_db({ip}, db)).get(ip)
+    if document is not None:
+        geo_cache.put(ip, document)
+    return document
+
+
+async def pull_documents_by(ips: set[str], db: AsyncSession) -> dict[str, GeoDocument]:
+    documents = {}
+    for ip in ips:
+        document = pull_snapshot_document(ip) or geo_cache.get(ip)
+        if document is not None:
+            documents[ip] = document
+    if settings.snapshot_mode == "only":
+        return documents
+
+    # single query for everything that was not cached
+    for ip, document in (
+        await pull_documents_from_db(ips - documents.keys(), db)
+    ).items():
+        documents[ip] = document
+        geo_cache.put(ip, document)
+    return documents
+
+
+def pull_snapshot_document(ip: str) -> GeoDocument | None:
+    # snapshot payloads are not cached, they are already in memory
+    if settings.snapshot_mode == "off":
+        return None
+    return snapshot_store.get(ip)
+
+
+async def pull_documents_from_db(
+    ips: set[str], db: AsyncSession
+) -> dict[str, GeoDocument]:
+    if not ips:
+        return {}
+    query = select(
+        GeoLocation.ip,
+        type_coerce(GeoLocation.ipstack_response, RawJSON),
+        GeoLocation.etag,
+        GeoLocation.updated_at,
+    ).where(GeoLocation.ip.in_(ips))
+    with timed("db"):
+        result = await db.execute(query)
+    return {ip: GeoDocument(*validated) for ip, *validated in result.all()}
+
+
+async def pull_projection_by(
+    ip: str, selection: FieldSelection, db: AsyncSession
+) -> GeoDocument | None:
+    """Return selected fields of stored ipstack response, picked by sqlite.
+
+    Compressed documents cannot be read by json functions, those are loaded
+    and projected in Python.
+    """
+    stored = type_coerce(GeoLocation.ipstack_response, String)
+    is_text = func.typeof(stored) == "text"
+    query = select(
+        case((is_text, selection.sql(stored))),
+        case((is_text, None), else_=stored),
+        GeoLocation.etag,
+        GeoLocation.updated_at,
+    ).where(GeoLocation.ip == ip)
+    with timed("db"):
+        result = await db.execute(query)
+    row = result.first()
+    if row is None:
+        return None
+    payload, compressed, etag, modified_at = row
+    if compressed is not None:
+        document = loads_json(storage_codec.decode(compressed))
+        payload = dumps_json(selection.project(document))
+    return GeoDocument(payload.encode(), _selection_etag(etag, selection), modified_at)
+
+
+async def pull_validators_by(ip: str, db: AsyncSession) -> tuple[str, datetime] | None:
+    query = select(GeoLocation.etag, GeoLocation.updated_at).where(GeoLocation.ip == ip)
+    with timed("db"):
+        result = await db.execute(query)
+    return result.first()
+
+
+async def stream_export(
+    db: AsyncSession, family: int | None, after: int, compress: bool
+) -> AsyncIterator[bytes]:
+    query = (
+        select(
+            GeoLocation.id,
+            GeoLocation.ip,
+            type_coerce(GeoLocation.ipstack_response, RawJSON),
+        )
+        .where(GeoLocation.id > after)
+        .order_by(GeoLocation.id)
+        .execution_options(yield_per=settings.export_chunk_size)
+    )
+    if family is not None:
+        query = query.where(GeoLocation.family == family)
+
+    # gzip container, so the stream is readable by any http client or gunzip
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        chunk = b"".join(
+            b'{"id":%d,"ip":"%s","ipstack_response":%s}\n' % (id, ip.encode(), payload)
+            for id, ip, payload in rows
+        )
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+        # let other requests run between chunks of a large export
+        await asyncio.sleep(0)
+    if compressor is not None:
+        yield compressor.flush()
+
+
+async def _create_geo_location(ip: str, db: AsyncSession, locator: Locator) -> dict:
+    # database only, snapshot may miss new rows or still have deleted ones
+    if await pull_existing_ips({ip}, db):
+        raise HTTPException(409, "Geo location already exist")
+
+    ipstack_response = await locator.get_location_for(ip)
+    if not ipstack_response:
+        raise HTTPException(400, "Could not find data for given address")
+
+    if settings.group_commit_enabled:
+        # connection goes back to the pool, waiting requests must not keep
+        # all of them from the writer
+        await db.rollback()
+        document = encode_document(ipstack_response, utcnow())
+        with timed("db"):
+            # committed together with inserts of concurrent requests
+            created = await group_commit.insert(
+                _location_row(ip, ipstack_response, document)
+            )
+        if not created:
+            raise HTTPException(409, "Geo location already exist")
+        geo_cache.put(ip, document)
+        return ipstack_response
+
+    geo_location = GeoLocation(ip=ip, ipstack_response=ipstack_response)
+    db.add(geo_location)
+    try:
+        with timed("db"):
+            # defaults are computed in python, so nothing has to be read back,
+            # the row may already be deleted by concurrent request
+            await db.commit()
+    except IntegrityError:
+        # inserted in the meantime by another worker process
+        await db.rollback()
+        raise HTTPException(409, "Geo location already exist")
+    geo_cache.put(
+        ip,
+        GeoDocument(
+            encode_payload(geo_location.ipstack_response),
+            geo_location.etag,
+            geo_location.updated_at,
+        ),
+    )
+
+    return geo_location.ipstack_response
+
+
+def _location_row(ip: str, ipstack_response: dict, document: GeoDocument) -> dict:
+    return {
+        "ip": ip,
+        "ipstack_response": ipstack_response,
+        "etag": document.etag,
+        "updated_at": document.modified_at,
+    }
+
+
+def encode_payload(value) -> bytes:
+    return dumps_json(value).encode()
+
+
+def encode_document(value, modified_at: datetime | None = None) -> GeoDocument:
+    payload = encode_payload(value)
+    return GeoDocument(payload, document_etag(payload), modified_at)
+
+
+def project_document(document: GeoDocument, selection: FieldSelection) -> GeoDocument:
+    projected = selection.project(loads_json(bytes(document.payload)))
+    etag = _selection_etag(document.etag, selection)
+    return GeoDocument(encode_payload(projected), etag, document.modified_at)
+
+
+def _selection_etag(etag: str, selection: FieldSelection | None) -> str:
+    # projections have their own etags, derived from the one of whole document
+    if selection is None:
+        return etag
+    return document_etag(f"{etag}:{selection.key}".encode())
+
+
+def _parse_fields(fields: str) -> FieldSelection:
+    try:
+        return FieldSelection(fields)
+    except ValueError as exc:
+        raise HTTPException(422, str(exc))
+
+
+def _cache_headers(etag: str, modified_at: datetime | None) -> dict[str, str]:
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"max-age={settings.http_cache_max_age}",
+    }
+    if modified_at is not None:
+        modified_at = modified_at.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(modified_at, usegmt=True)
+    return headers
+
+
+def _etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    """Compare If-None-Match (weak) or If-Match (strong) header with etag."""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == f'"{etag}"':
+            return True
+    return False
+
+
+def _accepts_gzip(header: str) -> bool:
+    """Whether Accept-Encoding allows gzip, explicitly or by `*`, with q > 0."""
+    qualities = {}
+    for candidate in header.lower().split(","):
+        coding, *params = (part.strip() for part in candidate.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def _raise_if_batch_size_invalid(size: int):
+    if not size:
+        raise HTTPException(400, "Ip or url has to be provided")
+    elif size > settings.batch_max_items:
+        raise HTTPException(
+            400, f"At most {settings.batch_max_items} ips/urls can be sent at once"
+        )
+
+
 def _raise_if_ip_and_url_not_exclusive(ip: IPAddress | None = None, url: str = None):
+    if message := _ip_and_url_exclusivity_error(ip, url):
+        raise HTTPException(400, message)
+
+
+def _ip_and_url_exclusivity_error(ip: IPAddress | None, url: str | None) -> str | None:
     if ip and url:
-        raise HTTPException(400, "Provide either ip or url (not both)")
+        return "Provide either ip or url (not both)"
     elif not ip and not url:
-        raise HTTPException(400, "Ip or url has to be provided")
+        return "Ip or url has to be provided"
+    return None
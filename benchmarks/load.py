@@ -0,0 +1,311 @@
+"""Latency and throughput of /geo endpoints under mixed load, served by uvicorn.
+
+Seeds sqlite database with ROWS generated locations (kept for later runs when
+--database is given), serves benchmarks.load_app with stand-ins for DNS and
+ipstack and drives it from CONCURRENCY clients for SECONDS. Reports p50/p95/p99
+latency and requests/s per operation, optionally saving them as JSON baseline
+or comparing them with one.
+
+Usage: python -m benchmarks.load [--rows N] [--concurrency N] [--seconds S]
+                                 [--mix get=70,get_url=10,post=10,delete=10]
+                                 [--dns-latency S] [--ipstack-latency S] [--workers N]
+                                 [--database PATH] [--save FILE] [--compare FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import func, select
+
+from database import Base
+from manage import import_documents, sync_engine
+from models import GeoLocation
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seeded_ip(n: int) -> str:
+    return f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+def new_ip(n: int) -> str:
+    # outside of seeded range, so POST creates new rows
+    return f"11.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+def location_of(ip: str) -> dict:
+    """Document shaped like ipstack response, of similar size."""
+    return {
+        "ip": ip,
+        "type": "ipv4",
+        "continent_code": "NA",
+        "continent_name": "North America",
+        "country_code": "US",
+        "country_name": "United States",
+        "region_code": "CA",
+        "region_name": "California",
+        "city": "Mountain View",
+        "zip": "94041",
+        "latitude": 37.38801956176758,
+        "longitude": -122.07431030273438,
+        "location": {
+            "geoname_id": 7173909,
+            "capital": "Washington D.C.",
+            "languages": [{"code": "en", "name": "English", "native": "English"}],
+            "country_flag": "https://assets.ipstack.com/flags/us.svg",
+            "country_flag_emoji": "🇺🇸",
+            "calling_code": "1",
+            "is_eu": False,
+        },
+    }
+
+
+def seed(path: str, rows: int):
+    url = f"sqlite:///{path}"
+    engine = sync_engine(url)
+    Base.metadata.create_all(engine)
+    with engine.connect() as connection:
+        stored = connection.scalar(select(func.count()).select_from(GeoLocation))
+    if stored < rows:
+        print(f"seeding {rows - stored} rows", file=sys.stderr)
+        documents = (
+            (seeded_ip(n), location_of(seeded_ip(n))) for n in range(stored, rows)
+        )
+        import_documents(engine, documents, report_every=10.0)
+    engine.dispose()
+
+
+class Server:
+    """benchmarks.load_app run by uvicorn in a subprocess."""
+
+    def __init__(self, database: str, args: argparse.Namespace):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{database}",
+            "RATE_LIMIT_ENABLED": "false",
+            "BENCH_DNS_LATENCY": str(args.dns_latency),
+            "BENCH_IPSTACK_LATENCY": str(args.ipstack_latency),
+        }
+        self.workers = args.workers
+        self.process = None
+
+    async def __aenter__(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "benchmarks.load_app:app",
+                "--port",
+                str(self.port),
+                "--workers",
+                str(self.workers),
+                "--log-level",
+                "warning",
+            ],
+            env=self.env,
+            cwd=ROOT,
+        )
+        async with httpx.AsyncClient(base_url=self.base_url) as client:
+            deadline = time.monotonic() + 30
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError("Server exited during startup")
+                try:
+                    await client.get("/metrics")
+                    return self
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        raise RuntimeError("Server did not start in 30 seconds")
+
+    async def __aexit__(self, *_):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Workload:
+    """Mixed requests: GET by seeded ip and by url, POST of new ips, DELETE of posted ones."""
+
+    def __init__(self, rows: int, mix: dict[str, int], seed: int):
+        self.rows = rows
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.random = random.Random(seed)
+        self.next_new = 0
+        self.posted = []
+
+    def next_request(self) -> tuple[str, str, str, dict]:
+        operation = self.random.choices(self.operations, self.weights)[0]
+        if operation == "delete" and not self.posted:
+            operation = "post"
+        match operation:
+            case "get":
+                ip = seeded_ip(self.random.randrange(self.rows))
+                return operation, "GET", "/geo", {"params": {"ip": ip}}
+            case "get_url":
+                url = f"host-{self.random.randrange(self.rows)}.bench"
+                return operation, "GET", "/geo", {"params": {"url": url}}
+            case "post":
+                self.next_new += 1
+                ip = new_ip(self.next_new)
+                return operation, "POST", "/geo", {"json": {"ip": ip}}
+            case "delete":
+                ip = self.posted.pop(self.random.randrange(len(self.posted)))
+                return operation, "DELETE", "/geo", {"params": {"ip": ip}}
+        raise ValueError(f"Unknown operation {operation}")
+
+    def completed(self, operation: str, options: dict, status: int):
+        # only stored addresses are deleted later
+        if operation == "post" and status == 201:
+            self.posted.append(options["json"]["ip"])
+
+
+async def drive(base_url: str, workload: Workload, args) -> dict:
+    latencies = {operation: [] for operation in workload.operations}
+    errors = dict.fromkeys(workload.operations, 0)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    recording = False
+
+    async def client_loop(client: httpx.AsyncClient, deadline: float):
+        while time.perf_counter() < deadline:
+            operation, method, path, options = workload.next_request()
+            start = time.perf_counter()
+            response = await client.request(method, path, **options)
+            elapsed = time.perf_counter() - start
+            workload.completed(operation, options, response.status_code)
+            if recording:
+                latencies[operation].append(elapsed)
+                # 409/404 are expected answers, server errors are not
+                errors[operation] += response.status_code >= 500
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        if args.warmup:
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(
+                *[client_loop(client, deadline) for _ in range(args.concurrency)]
+            )
+        recording = True
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        await asyncio.gather(
+            *[client_loop(client, deadline) for _ in range(args.concurrency)]
+        )
+        elapsed = time.perf_counter() - started
+
+    results = {
+        operation: summarize(values, errors[operation], elapsed)
+        for operation, values in latencies.items()
+    }
+    every = [value for values in latencies.values() for value in values]
+    results["total"] = summarize(every, sum(errors.values()), elapsed)
+    return results
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+
+    def percentile(p: float) -> float | None:
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(p / 100 * len(latencies)))
+        return round(latencies[index] * 1000, 3)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+def report(results: dict, baseline: dict | None = None, tolerance: float = 0.1) -> bool:
+    """Print results, with change against baseline. Return False on regression."""
+    columns = ["requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms"]
+    print(f"{'operation':<10}" + "".join(f"{c:>20}" for c in columns))
+    ok = True
+    for operation, result in results.items():
+        cells = []
+        for column in columns:
+            value = result[column]
+            cell = "-" if value is None else str(value)
+            before = (baseline or {}).get(operation, {}).get(column)
+            if value is not None and before and column not in ("requests", "errors"):
+                change = (value - before) / before
+                cell += f" ({change:+.0%})"
+                # throughput should not drop, latency should not grow
+                worse = -change if column == "rps" else change
+                if worse > tolerance:
+                    ok = False
+                    cell += "!"
+            cells.append(f"{cell:>20}")
+        print(f"{operation:<10}" + "".join(cells))
+    return ok
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        operation, _, weight = part.partition("=")
+        mix[operation.strip()] = int(weight)
+    return mix
+
+
+async def main(args) -> bool:
+    database = args.database or os.path.join(tempfile.mkdtemp(), "load.db")
+    seed(database, args.rows)
+    workload = Workload(args.rows, args.mix, args.seed)
+    async with Server(database, args) as server:
+        results = await drive(server.base_url, workload, args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+    ok = report(results, baseline, args.tolerance)
+    if args.save:
+        config = {k: v for k, v in vars(args).items() if k not in ("save", "compare")}
+        with open(args.save, "w") as file:
+            json.dump({"config": config, "results": results}, file, indent=2)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument(
+        "--mix", type=parse_mix, default="get=70,get_url=10,post=10,delete=10"
+    )
+    parser.add_argument("--dns-latency", type=float, default=0.005)
+    parser.add_argument("--ipstack-latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--database", help="seeded database file, reused when it exists"
+    )
+    parser.add_argument("--save", help="write results as JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare results with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change counted as regression, exit status is 1 on it",
+    )
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
@@ -0,0 +1,38 @@
+"""Application served by benchmarks.load, with stand-ins for DNS and ipstack.
+
+Hostnames `host-<n>.bench` resolve to the n-th seeded address, ipstack
+answers with generated location of any address. Both wait BENCH_DNS_LATENCY
+and BENCH_IPSTACK_LATENCY seconds, to model the real upstreams offline.
+"""
+
+import asyncio
+import os
+import socket
+
+from benchmarks.load import location_of, seeded_ip
+from utils.ipstack_client import IpstackClient
+from utils.resolver import Resolver
+
+DNS_LATENCY = float(os.environ.get("BENCH_DNS_LATENCY", "0"))
+IPSTACK_LATENCY = float(os.environ.get("BENCH_IPSTACK_LATENCY", "0"))
+
+
+async def _query(self, hostname: str) -> tuple[list[str], float]:
+    await asyncio.sleep(DNS_LATENCY)
+    name, _, domain = hostname.partition(".")
+    if domain != "bench" or not name.startswith("host-"):
+        raise socket.gaierror
+    return [seeded_ip(int(name.removeprefix("host-")))], 60.0
+
+
+async def _get_location(self, *ips: str) -> dict | list[dict]:
+    await asyncio.sleep(IPSTACK_LATENCY)
+    if len(ips) == 1:
+        return location_of(ips[0])
+    return [location_of(ip) for ip in ips]
+
+
+Resolver._query = _query
+IpstackClient.get_location = _get_location
+
+from app import app  # noqa: E402
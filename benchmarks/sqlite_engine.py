@@ -0,0 +1,90 @@
+"""Concurrent read/write throughput of default and tuned sqlite engine profiles.
+
+Usage: python -m benchmarks.sqlite_engine [--rows N] [--readers N] [--writers N] [--seconds S]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, create_engine, sqlite_pragmas, pool_options
+from models import GeoLocation
+
+PAYLOAD = {"country_code": "US", "city": "Mountain View", "latitude": 37.38}
+
+
+def _ip(n: int) -> str:
+    return f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+async def run_profile(name: str, engine_options: dict, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), f"{name}.db")
+    url = f"sqlite+aiosqlite:///{path}"
+    engine = create_engine(url, **engine_options(url))
+    make_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with make_session() as db:
+        db.add_all(
+            GeoLocation(ip=_ip(n), ipstack_response=PAYLOAD) for n in range(args.rows)
+        )
+        await db.commit()
+
+    counts = {"reads": 0, "writes": 0}
+    next_row = args.rows
+    deadline = time.perf_counter() + args.seconds
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            async with make_session() as db:
+                ip = _ip(random.randrange(args.rows))
+                await db.execute(select(GeoLocation).where(GeoLocation.ip == ip))
+            counts["reads"] += 1
+
+    async def writer():
+        nonlocal next_row
+        while time.perf_counter() < deadline:
+            next_row += 1
+            async with make_session() as db:
+                db.add(GeoLocation(ip=_ip(next_row), ipstack_response=PAYLOAD))
+                await db.commit()
+            counts["writes"] += 1
+
+    await asyncio.gather(
+        *[reader() for _ in range(args.readers)],
+        *[writer() for _ in range(args.writers)],
+    )
+    await engine.dispose()
+    return {k: round(v / args.seconds) for k, v in counts.items()}
+
+
+async def main(args):
+    profiles = {
+        # what database.py used to create: no pragmas, library pool defaults
+        "default": lambda url: {},
+        "tuned": lambda url: {
+            "pragmas": sqlite_pragmas(),
+            **pool_options(url, args.readers + args.writers),
+        },
+    }
+    print(f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}")
+    for name, options in profiles.items():
+        result = await run_profile(name, options, args)
+        print(f"{name:<10}{result['reads']:>10}{result['writes']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,169 @@
+"""Stored size and encode/decode cost of ipstack responses per storage codec.
+
+Documents are read from --database (any codec) or generated. The first
+--train of them train dictionaries, the rest are encoded with every codec
+(zstd ones only with zstandard installed) and written to a scratch sqlite
+file, to report bytes per row in the column and in the database file.
+
+Usage: python -m benchmarks.storage_codec [--rows N] [--train N] [--size BYTES]
+                                          [--database PATH]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from database import dumps_json
+from manage import load_dictionaries, sync_engine
+from storage_codec import (
+    StorageCodec,
+    storage_codec,
+    train_dictionary,
+    zstd_available,
+)
+
+# country, continent, capital, language, calling code, cities
+COUNTRIES = [
+    ("US", "NA", "North America", "United States", "Washington D.C.", "en", "1"),
+    ("DE", "EU", "Europe", "Germany", "Berlin", "de", "49"),
+    ("GB", "EU", "Europe", "United Kingdom", "London", "en", "44"),
+    ("PL", "EU", "Europe", "Poland", "Warsaw", "pl", "48"),
+    ("JP", "AS", "Asia", "Japan", "Tokyo", "ja", "81"),
+    ("BR", "SA", "South America", "Brazil", "Brasilia", "pt", "55"),
+]
+LANGUAGES = {
+    "en": ("English", "English"),
+    "de": ("German", "Deutsch"),
+    "pl": ("Polish", "Polski"),
+    "ja": ("Japanese", "日本語 (にほんご／にっぽんご)"),
+    "pt": ("Portuguese", "Português"),
+}
+
+
+def generated(rows: int, seed: int) -> list[bytes]:
+    """Documents shaped like ipstack responses, with varied values."""
+    rng = random.Random(seed)
+    documents = []
+    for n in range(rows):
+        code, continent_code, continent, country, capital, language, calling = (
+            rng.choice(COUNTRIES)
+        )
+        name, native = LANGUAGES[language]
+        ip = f"{rng.randrange(1, 224)}.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+        document = {
+            "ip": ip,
+            "type": "ipv4",
+            "continent_code": continent_code,
+            "continent_name": continent,
+            "country_code": code,
+            "country_name": country,
+            "region_code": f"R{rng.randrange(100)}",
+            "region_name": f"Region {rng.randrange(100)}",
+            "city": f"City {rng.randrange(5000)}",
+            "zip": f"{rng.randrange(100000):05d}",
+            "latitude": rng.uniform(-90, 90),
+            "longitude": rng.uniform(-180, 180),
+            "msa": None,
+            "dma": None,
+            "radius": "0",
+            "ip_routing_type": "fixed",
+            "connection_type": rng.choice(["tx", "cable", "dsl"]),
+            "location": {
+                "geoname_id": rng.randrange(10_000_000),
+                "capital": capital,
+                "languages": [{"code": language, "name": name, "native": native}],
+                "country_flag": f"https://assets.ipstack.com/flags/{code.lower()}.svg",
+                "country_flag_emoji": "".join(
+                    chr(0x1F1E6 + ord(c) - ord("A")) for c in code
+                ),
+                "country_flag_emoji_unicode": " ".join(
+                    f"U+{0x1F1E6 + ord(c) - ord('A'):X}" for c in code
+                ),
+                "calling_code": calling,
+                "is_eu": continent_code == "EU",
+            },
+        }
+        documents.append(dumps_json(document).encode())
+    return documents
+
+
+def stored(path: str, rows: int) -> list[bytes]:
+    engine = sync_engine(f"sqlite:///{path}")
+    with engine.connect() as connection:
+        load_dictionaries(connection)
+        result = connection.exec_driver_sql(
+            "SELECT ipstack_response FROM geo_location ORDER BY random() LIMIT ?",
+            (rows,),
+        )
+        documents = [storage_codec.decode(value) for value in result.scalars()]
+    engine.dispose()
+    return documents
+
+
+def measure(codec: StorageCodec, documents: list[bytes]) -> dict:
+    texts = [document.decode() for document in documents]
+    start = time.perf_counter()
+    encoded = [codec.encode(text) for text in texts]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for value in encoded:
+        codec.decode(value)
+    decode_time = time.perf_counter() - start
+
+    path = os.path.join(tempfile.mkdtemp(), "codec.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE geo_location (id INTEGER PRIMARY KEY, doc JSON)")
+    connection.executemany(
+        "INSERT INTO geo_location (doc) VALUES (?)", ((value,) for value in encoded)
+    )
+    connection.commit()
+    connection.execute("VACUUM")
+    pages = connection.execute("PRAGMA page_count").fetchone()[0]
+    page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    connection.close()
+
+    rows = len(documents)
+    column = sum(len(v.encode() if isinstance(v, str) else v) for v in encoded)
+    return {
+        "column_bytes": round(column / rows),
+        "file_bytes": round(pages * page_size / rows),
+        "encode_us": round(encode_time / rows * 1e6, 2),
+        "decode_us": round(decode_time / rows * 1e6, 2),
+    }
+
+
+def main(args):
+    if args.database:
+        documents = stored(args.database, args.rows + args.train)
+    else:
+        documents = generated(args.rows + args.train, args.seed)
+    training, documents = documents[: args.train], documents[args.train :]
+
+    variants = {"none": StorageCodec("none", 0), "zlib": StorageCodec("zlib", 0)}
+    trained = StorageCodec("zlib", 1)
+    trained.register(1, "zlib", train_dictionary("zlib", training, args.size))
+    variants["zlib+trained"] = trained
+    if zstd_available():
+        variants["zstd"] = StorageCodec("zstd", 0)
+        trained = StorageCodec("zstd", 1)
+        trained.register(1, "zstd", train_dictionary("zstd", training, args.size))
+        variants["zstd+trained"] = trained
+
+    columns = ["column_bytes", "file_bytes", "encode_us", "decode_us"]
+    print(f"{'codec':<14}" + "".join(f"{column:>14}" for column in columns))
+    for name, codec in variants.items():
+        result = measure(codec, documents)
+        print(f"{name:<14}" + "".join(f"{result[c]:>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--train", type=int, default=2_000)
+    parser.add_argument("--size", type=int, default=16 * 1024, help="dictionary size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", help="sqlite file with stored documents")
+    main(parser.parse_args())
@@ -1,10 +1,193 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import json
+import socket
+from contextlib import AsyncExitStack
+from ipaddress import IPv4Address, IPv6Address, ip_address
+from sqlalchemy import JSON, LargeBinary, Text, TypeDecorator, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite+aiosqlite:///./app.db"
+from settings import settings
+from storage_codec import storage_codec
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(value) -> str:
+    """Serialize to canonical compact JSON, the form documents are stored in."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads_json(value: str | bytes):
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+
+def sqlite_pragmas(read_only: bool = False) -> dict[str, str | int]:
+    pragmas = {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout,
+        # negative value is size in KiB instead of pages
+        "cache_size": -settings.sqlite_cache_size,
+        "mmap_size": settings.sqlite_mmap_size,
+    }
+    if read_only:
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+
+def create_engine(
+    url: str, pragmas: dict[str, str | int] | None = None, **kwargs
+) -> AsyncEngine:
+    """Create async engine, applying pragmas to every new sqlite connection."""
+    engine = create_async_engine(url, json_serializer=dumps_json, **kwargs)
+    if pragmas and make_url(url).get_backend_name() == "sqlite":
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_pragmas(dbapi_connection, _):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.close()
+
+    return engine
+
+
+def pool_options(url: str, pool_size: int) -> dict:
+    # in-memory sqlite uses single static connection, which takes no sizing
+    if make_url(url).database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": settings.database_max_overflow,
+        "pool_timeout": settings.database_pool_timeout,
+    }
+
+
+async def warm_pool(engine: AsyncEngine, connections: int):
+    """Open connections of engine's pool ahead of the first requests.
+
+    Every connection is pinged, so unreachable database fails the startup.
+    """
+    async with AsyncExitStack() as stack:
+        # all held at once, so they are distinct connections left in the pool
+        for _ in range(max(1, connections)):
+            connection = await stack.enter_async_context(engine.connect())
+            await connection.exec_driver_sql("SELECT 1")
+
+
+engine = create_engine(
+    settings.database_url,
+    pragmas=sqlite_pragmas(),
+    echo=settings.database_echo,
+    **pool_options(settings.database_url, settings.database_pool_size),
+)
 
 SessionMaker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+if settings.database_read_pool:
+    read_engine = create_engine(
+        settings.database_url,
+        pragmas=sqlite_pragmas(read_only=True),
+        echo=settings.database_echo,
+        **pool_options(settings.database_url, settings.database_read_pool_size),
+    )
+    ReadSessionMaker = sessionmaker(
+        read_engine, expire_on_commit=False, class_=AsyncSession
+    )
+else:
+    read_engine, ReadSessionMaker = engine, SessionMaker
+
 Base = declarative_base()
+
+
+def canonical_ip(value: IPv4Address | IPv6Address | str | bytes | int):
+    """Return ip address object, with IPv4-mapped IPv6 addresses mapped back to IPv4."""
+    address = ip_address(value)
+    if isinstance(address, IPv6Address) and address.ipv4_mapped:
+        return address.ipv4_mapped
+    return address
+
+
+IPV4_MAPPED_PREFIX = bytes(10) + b"\xff\xff"
+
+
+def pack_ip(ip: str) -> bytes:
+    """Packed canonical form of textual ip, like canonical_ip(ip).packed, but faster."""
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except (OSError, TypeError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+    except (OSError, TypeError):
+        raise ValueError(f"{ip!r} does not appear to be an IP address") from None
+    if packed.startswith(IPV4_MAPPED_PREFIX):
+        return packed[12:]
+    return packed
+
+
+class IPAddressType(TypeDecorator):
+    """Ip address stored as packed big-endian bytes, 4 for IPv4 and 16 for IPv6.
+
+    Any textual form of an address is canonicalized before it is bound, so it
+    matches the same row, and results come back as canonical strings.
+    Packed values sort like the addresses themselves within one family.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return canonical_ip(value).packed
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(ip_address(value))
+
+
+class StoredJSON(TypeDecorator):
+    """JSON document stored as text or compressed by storage_codec."""
+
+    impl = JSON
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return storage_codec.encode(dumps_json(value))
+
+        return process
+
+    def result_processor(self, dialect, coltype):
+        def process(value):
+            if value is None:
+                return None
+            return loads_json(storage_codec.decode(value))
+
+        return process
+
+
+class RawJSON(TypeDecorator):
+    """JSON column read as stored utf-8 bytes, without decoding the document.
+
+    Used with ``type_coerce`` to serve stored documents as they are, only
+    compressed ones are decompressed.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return storage_codec.decode(value)
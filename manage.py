@@ -0,0 +1,358 @@
+"""Maintenance commands working directly on the database, outside of the API.
+
+Usage: python manage.py import FILE [--format ndjson|csv] [--on-conflict skip|update]
+                                    [--chunk-size N] [--transaction-size N] [--rebuild-indexes]
+       python manage.py build-snapshot PATH
+       python manage.py train-dictionary [--codec zlib|zstd] [--size BYTES] [--samples N]
+       python manage.py recompress [--chunk-size N]
+"""
+
+import argparse
+import csv
+import sys
+import time
+from typing import Iterator
+
+from sqlalchemy import Connection, Engine, create_engine, event, insert
+from sqlalchemy.engine import make_url
+
+from database import dumps_json, loads_json, pack_ip, sqlite_pragmas
+from models import GeoLocation, StorageDictionary, document_etag, utcnow
+from settings import settings
+from storage_codec import storage_codec, train_dictionary
+from utils.snapshot import build_snapshot
+
+# csv documents can be much longer than csv module allows by default
+csv.field_size_limit(sys.maxsize)
+
+INSERT = (
+    "INSERT INTO geo_location"
+    " (ip, family, ipstack_response, etag, version, updated_at, fetched_at)"
+    " VALUES (?1, ?2, ?3, ?4, 1, ?5, ?5)"
+)
+ON_CONFLICT = {
+    "skip": " ON CONFLICT (ip) DO NOTHING",
+    # unchanged documents keep their etag and version
+    "update": (
+        " ON CONFLICT (ip) DO UPDATE SET ipstack_response = excluded.ipstack_response,"
+        " etag = excluded.etag, version = version + 1, updated_at = excluded.updated_at,"
+        " fetched_at = excluded.fetched_at"
+        " WHERE etag != excluded.etag"
+    ),
+}
+# which copy of a duplicated ip survives index rebuild
+KEEP_ROW = {"skip": "MIN", "update": "MAX"}
+
+
+def sync_engine(url: str) -> Engine:
+    """Synchronous engine for offline commands, with the same sqlite pragmas as the API."""
+    url = make_url(url)
+    if url.drivername == "sqlite+aiosqlite":
+        url = url.set(drivername="sqlite")
+    engine = create_engine(url)
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+
+def read_documents(path: str, format: str) -> Iterator[tuple[str | None, dict]]:
+    """Yield (ip, ipstack response) pairs from NDJSON or CSV file.
+
+    NDJSON lines are either raw ipstack responses or GET /geo/export lines,
+    CSV files have `ip` and `ipstack_response` (JSON text) columns. Rows that
+    are not JSON objects or have no ip, like ipstack error responses, are
+    yielded with None ip and rejected on import.
+    """
+    with open(path, newline="" if format == "csv" else None, encoding="utf-8") as file:
+        if format == "csv":
+            for row in csv.DictReader(file):
+                document = _loads_document(row.get("ipstack_response") or "")
+                yield row.get("ip") if document else None, document
+            return
+        for line in file:
+            if not line.strip():
+                continue
+            document = _loads_document(line)
+            if "ipstack_response" in document:
+                yield document.get("ip"), document["ipstack_response"]
+            else:
+                yield document.get("ip"), document
+
+
+def _loads_document(text: str) -> dict:
+    try:
+        document = loads_json(text)
+    except ValueError:
+        return {}
+    return document if isinstance(document, dict) else {}
+
+
+def import_documents(
+    engine: Engine,
+    documents: Iterator[tuple[str | None, dict]],
+    on_conflict: str = "skip",
+    chunk_size: int = 10_000,
+    transaction_size: int = 500_000,
+    rebuild_indexes: bool = False,
+    report_every: float = 1.0,
+) -> dict[str, int]:
+    """Insert documents with chunked executemany, committing every transaction_size rows."""
+    stats = {"read": 0, "written": 0, "rejected": 0}
+    indexes = GeoLocation.__table__.indexes
+    # without unique index there is nothing to detect conflicts on,
+    # duplicates are removed before it is created again
+    statement = INSERT if rebuild_indexes else INSERT + ON_CONFLICT[on_conflict]
+    started = last_report = time.perf_counter()
+
+    with engine.connect() as connection:
+        load_dictionaries(connection)
+        if rebuild_indexes:
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+            connection.commit()
+
+        pending = 0
+        for chunk in _chunks(documents, chunk_size, stats):
+            result = connection.exec_driver_sql(statement, chunk)
+            stats["written"] += max(result.rowcount, 0)
+            pending += len(chunk)
+            if pending >= transaction_size:
+                connection.commit()
+                pending = 0
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                _report(stats, last_report - started)
+        connection.commit()
+
+        if rebuild_indexes:
+            removed = connection.exec_driver_sql(
+                "DELETE FROM geo_location WHERE id NOT IN "
+                f"(SELECT {KEEP_ROW[on_conflict]}(id) FROM geo_location GROUP BY ip)"
+            )
+            if on_conflict == "skip":
+                # removed copies are the new rows, with update the old ones
+                stats["written"] -= removed.rowcount
+            for index in indexes:
+                index.create(connection)
+            connection.commit()
+
+    _report(stats, time.perf_counter() - started)
+    return stats
+
+
+def load_dictionaries(connection: Connection):
+    """Register storage dictionaries, so documents compressed with them can be read."""
+    with connection.begin():
+        rows = connection.exec_driver_sql(
+            "SELECT id, codec, data FROM storage_dictionary"
+        )
+        storage_codec.load(rows)
+    # fails before anything is written with dictionary that does not exist
+    storage_codec.check()
+
+
+def train(engine: Engine, codec: str, size: int, samples: int) -> int:
+    """Store dictionary trained on randomly sampled documents, return its id."""
+    with engine.connect() as connection:
+        load_dictionaries(connection)
+        rows = connection.exec_driver_sql(
+            "SELECT ipstack_response FROM geo_location ORDER BY random() LIMIT ?",
+            (samples,),
+        )
+        documents = [storage_codec.decode(stored) for stored in rows.scalars()]
+        data = train_dictionary(codec, documents, size)
+        query = insert(StorageDictionary).values(codec=codec, data=data)
+        dictionary = connection.execute(query).inserted_primary_key[0]
+        connection.commit()
+    return dictionary
+
+
+def recompress(
+    engine: Engine, chunk_size: int = 10_000, report_every: float = 1.0
+) -> dict[str, int]:
+    """Rewrite stored documents in the form of STORAGE_CODEC and STORAGE_DICTIONARY.
+
+    Documents stay the same, so their etag and version are kept. Rows changed
+    since they were read are skipped, they were written in the new form.
+    """
+    stats = {"read": 0, "written": 0, "bytes_before": 0, "bytes_after": 0}
+    started = last_report = time.perf_counter()
+    with engine.connect() as connection:
+        load_dictionaries(connection)
+        after = 0
+        while rows := connection.exec_driver_sql(
+            "SELECT id, version, ipstack_response FROM geo_location"
+            " WHERE id > ? ORDER BY id LIMIT ?",
+            (after, chunk_size),
+        ).all():
+            changed = []
+            for id, version, stored in rows:
+                encoded = storage_codec.encode(storage_codec.decode(stored).decode())
+                stats["bytes_before"] += _stored_size(stored)
+                stats["bytes_after"] += _stored_size(encoded)
+                if encoded != stored:
+                    changed.append((encoded, id, version))
+            if changed:
+                result = connection.exec_driver_sql(
+                    "UPDATE geo_location SET ipstack_response = ?"
+                    " WHERE id = ? AND version = ?",
+                    changed,
+                )
+                stats["written"] += max(result.rowcount, 0)
+            connection.commit()
+            stats["read"] += len(rows)
+            after = rows[-1][0]
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                _report_recompress(stats, last_report - started)
+    _report_recompress(stats, time.perf_counter() - started)
+    return stats
+
+
+def _stored_size(value: str | bytes) -> int:
+    return len(value.encode() if isinstance(value, str) else value)
+
+
+def _chunks(
+    documents: Iterator[tuple[str | None, dict]], size: int, stats: dict[str, int]
+) -> Iterator[list[tuple]]:
+    chunk = []
+    # bound as text in the form sqlalchemy stores sqlite datetimes in
+    updated_at = utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+    for ip, document in documents:
+        stats["read"] += 1
+        try:
+            packed = pack_ip(ip)
+        except ValueError:
+            stats["rejected"] += 1
+            continue
+        family = 4 if len(packed) == 4 else 6
+        payload = dumps_json(document)
+        etag = document_etag(payload.encode())
+        stored = storage_codec.encode(payload)
+        chunk.append((packed, family, stored, etag, updated_at))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _report(stats: dict[str, int], elapsed: float):
+    rate = stats["read"] / elapsed if elapsed else 0
+    print(
+        f"read {stats['read']} rows, written {stats['written']}, "
+        f"rejected {stats['rejected']}, {rate:,.0f} rows/s",
+        file=sys.stderr,
+    )
+
+
+def _report_recompress(stats: dict[str, int], elapsed: float):
+    rows = stats["read"] or 1
+    print(
+        f"read {stats['read']} rows, rewritten {stats['written']}, "
+        f"{stats['bytes_before'] / rows:,.0f} -> {stats['bytes_after'] / rows:,.0f}"
+        f" bytes per row, {stats['read'] / elapsed if elapsed else 0:,.0f} rows/s",
+        file=sys.stderr,
+    )
+
+
+def run_import(args: argparse.Namespace):
+    engine = sync_engine(args.database_url)
+    try:
+        import_documents(
+            engine,
+            read_documents(args.file, args.format),
+            on_conflict=args.on_conflict,
+            chunk_size=args.chunk_size,
+            transaction_size=args.transaction_size,
+            rebuild_indexes=args.rebuild_indexes,
+        )
+    finally:
+        engine.dispose()
+
+
+def run_build_snapshot(args: argparse.Namespace):
+    engine = sync_engine(args.database_url)
+    try:
+        start = time.perf_counter()
+        with engine.connect() as connection:
+            load_dictionaries(connection)
+            count = build_snapshot(connection, args.path)
+        elapsed = time.perf_counter() - start
+        print(
+            f"written {count} locations to {args.path} in {elapsed:.1f}s",
+            file=sys.stderr,
+        )
+    finally:
+        engine.dispose()
+
+
+def run_train_dictionary(args: argparse.Namespace):
+    engine = sync_engine(args.database_url)
+    try:
+        dictionary = train(engine, args.codec, args.size, args.samples)
+    finally:
+        engine.dispose()
+    print(f"stored {args.codec} dictionary {dictionary}", file=sys.stderr)
+
+
+def run_recompress(args: argparse.Namespace):
+    engine = sync_engine(args.database_url)
+    try:
+        recompress(engine, args.chunk_size)
+    finally:
+        engine.dispose()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=settings.database_url)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="load ipstack responses from a file")
+    load.add_argument("file")
+    load.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    load.add_argument("--on-conflict", choices=list(ON_CONFLICT), default="skip")
+    load.add_argument("--chunk-size", type=int, default=10_000)
+    load.add_argument("--transaction-size", type=int, default=500_000)
+    load.add_argument(
+        "--rebuild-indexes",
+        action="store_true",
+        help="drop indexes for the load and create them again afterwards",
+    )
+    load.set_defaults(run=run_import)
+
+    snapshot = commands.add_parser(
+        "build-snapshot", help="write read-only snapshot file served by GET /geo"
+    )
+    snapshot.add_argument("path")
+    snapshot.set_defaults(run=run_build_snapshot)
+
+    training = commands.add_parser(
+        "train-dictionary", help="store compression dictionary trained on documents"
+    )
+    training.add_argument("--codec", choices=["zlib", "zstd"], default="zlib")
+    training.add_argument("--size", type=int, default=16 * 1024)
+    training.add_argument("--samples", type=int, default=10_000)
+    training.set_defaults(run=run_train_dictionary)
+
+    rewrite = commands.add_parser(
+        "recompress", help="rewrite stored documents with the configured codec"
+    )
+    rewrite.add_argument("--chunk-size", type=int, default=10_000)
+    rewrite.set_defaults(run=run_recompress)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,85 @@
-from sqlalchemy import Column, Integer, String, JSON
-from database import Base
+import hashlib
+from datetime import datetime, timezone
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    LargeBinary,
+    SmallInteger,
+    String,
+    JSON,
+    UniqueConstraint,
+)
+from database import Base, IPAddressType, StoredJSON, canonical_ip, dumps_json
+
+
+def document_etag(payload: bytes) -> str:
+    """Content hash of serialized document, used as its strong ETag."""
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def utcnow() -> datetime:
+    # sqlite stores naive datetimes, all of them are UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _family_of(column: str):
+    def family(context) -> int:
+        return canonical_ip(context.get_current_parameters()[column]).version
+
+    return family
+
+
+def _etag_of(column: str):
+    def etag(context) -> str:
+        document = context.get_current_parameters()[column]
+        return document_etag(dumps_json(document).encode())
+
+    return etag
 
 
 class GeoLocation(Base):
     __tablename__ = "geo_location"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    ip = Column(String, unique=True, index=True)
+    ip = Column(IPAddressType, unique=True, index=True)
+    # 4 or 6, derived from ip on insert
+    family = Column(SmallInteger, nullable=False, default=_family_of("ip"))
+    ipstack_response = Column(StoredJSON)
+    etag = Column(String(32), nullable=False, default=_etag_of("ipstack_response"))
+    # bumped by every ORM update, guards conditional deletes
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, nullable=False, default=utcnow)
+    # when ipstack was last asked, stale rows are picked up by the refresher
+    fetched_at = Column(DateTime, nullable=False, index=True, default=utcnow)
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+class GeoNetwork(Base):
+    """Ipstack response applying to every address of a network."""
+
+    __tablename__ = "geo_network"
+    __table_args__ = (UniqueConstraint("network", "prefix_length"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    network = Column(IPAddressType, nullable=False)
+    prefix_length = Column(SmallInteger, nullable=False)
+    family = Column(SmallInteger, nullable=False, default=_family_of("network"))
     ipstack_response = Column(JSON)
+
+    @property
+    def cidr(self) -> str:
+        return f"{self.network}/{self.prefix_length}"
+
+
+class StorageDictionary(Base):
+    """Compression dictionary of stored ipstack responses, never changed once written."""
+
+    __tablename__ = "storage_dictionary"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # "zlib" or "zstd"
+    codec = Column(String(8), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=utcnow)
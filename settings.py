@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -5,5 +7,119 @@ class Settings(BaseSettings):
     ipstack_key: str = ""
     logger_name: str = "geolocation"
 
+    database_url: str = "sqlite+aiosqlite:///./app.db"
+    database_echo: bool = False
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30.0
+    # separate pool of query_only connections used by GET endpoints
+    database_read_pool: bool = False
+    database_read_pool_size: int = 10
+    # sqlite pragmas, cache_size in KiB and busy_timeout in milliseconds
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout: int = 5000
+    sqlite_cache_size: int = 64 * 1024
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+
+    # shared ipstack client, timeouts in seconds
+    ipstack_url: str = "http://api.ipstack.com"
+    ipstack_connect_timeout: float = 3.0
+    ipstack_read_timeout: float = 10.0
+    ipstack_max_in_flight: int = 32
+    ipstack_retries: int = 2
+    ipstack_retry_backoff: float = 0.2
+    # max ipstack calls in flight for one bulk request, ips sent per call
+    # (values above 1 need plan with bulk lookup, at most 50)
+    ipstack_concurrency: int = 8
+    ipstack_bulk_size: int = 1
+    # upstream protection: whole call (with retries) must finish within deadline,
+    # calls slower than slow_call count as failed and shrink concurrency limit,
+    # circuit opens for open_for seconds when failure_ratio of last window calls failed
+    ipstack_deadline: float = 8.0
+    ipstack_slow_call: float = 2.0
+    ipstack_breaker_failure_ratio: float = 0.5
+    ipstack_breaker_window: int = 20
+    ipstack_breaker_open_for: float = 30.0
+    ipstack_breaker_probes: int = 3
+
+    # compression of stored ipstack responses, applied to rows written from now
+    # on (`manage.py recompress` rewrites the rest); dictionary is an id from
+    # `manage.py train-dictionary`, 0 is the built-in one (zlib) or none (zstd)
+    storage_codec: Literal["none", "zlib", "zstd"] = "none"
+    storage_dictionary: int = 0
+
+    # in-process cache of GET /geo responses, 0 entries disables it
+    cache_max_entries: int = 10_000
+    cache_max_bytes: int = 32 * 1024 * 1024
+    cache_ttl: float = 300.0
+
+    # warm start: up to cache_warm_size most recently used ips are written to
+    # cache_warm_path on shutdown and their documents loaded on startup
+    cache_warm_path: str = ""
+    cache_warm_size: int = 1000
+
+    # cache shared by worker processes of one host, file is created at given
+    # path (preferably on tmpfs, like /dev/shm), empty path disables it;
+    # documents longer than slot size minus 64 bytes are not shared
+    shared_cache_path: str = ""
+    shared_cache_slots: int = 65536
+    shared_cache_slot_size: int = 2048
+
+    # read-only snapshot file built by `manage.py build-snapshot`, checked for
+    # a new version every snapshot_poll_interval seconds; "first" serves GET
+    # /geo from it before the database, "only" never reads the database
+    snapshot_path: str = ""
+    snapshot_mode: Literal["off", "first", "only"] = "off"
+    snapshot_poll_interval: float = 5.0
+
+    # networks written by other worker processes are picked up within
+    # network_reload_interval seconds, 0 disables reloading
+    network_reload_interval: float = 5.0
+
+    # max-age of GET /geo responses in Cache-Control header
+    http_cache_max_age: int = 60
+
+    # rows fetched per round trip by GET /geo/export
+    export_chunk_size: int = 1000
+
+    # background refresh of stored ipstack responses older than
+    # refresh_max_age seconds, with at most refresh_rate ipstack calls per second;
+    # only the worker holding refresh_lock_path runs it (empty path: every worker)
+    refresh_enabled: bool = False
+    refresh_lock_path: str = "./refresh.lock"
+    refresh_max_age: float = 30 * 24 * 3600.0
+    refresh_interval: float = 300.0
+    refresh_rate: float = 1.0
+    refresh_batch_size: int = 50
+
+    # token buckets per client ip and route, reads (GET) are served from stored
+    # data and get larger budget than writes, which may call ipstack
+    rate_limit_enabled: bool = True
+    rate_limit_read_rate: float = 20.0
+    rate_limit_read_burst: int = 40
+    rate_limit_write_rate: float = 2.0
+    rate_limit_write_burst: int = 10
+    rate_limit_max_clients: int = 100_000
+    # take client ip from X-Forwarded-For, only behind a trusted proxy
+    rate_limit_trust_forwarded: bool = False
+
+    # POST /geo inserts of concurrent requests are collected for up to
+    # group_commit_delay seconds (or max_batch rows) and committed together
+    group_commit_enabled: bool = False
+    group_commit_delay: float = 0.002
+    group_commit_max_batch: int = 100
+
+    # max number of ips/urls accepted by batch endpoints
+    batch_max_items: int = 100
+
+    # url resolution, ttl is capped by dns_max_ttl and taken from
+    # dns_default_ttl when the resolver does not report one
+    dns_ipv6: bool = False
+    dns_default_ttl: float = 60.0
+    dns_max_ttl: float = 3600.0
+    dns_negative_ttl: float = 5.0
+    dns_cache_max_entries: int = 10_000
+
 
 settings = Settings()
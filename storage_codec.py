@@ -0,0 +1,191 @@
+"""Optional compression of stored ipstack responses.
+
+Documents are stored either as JSON text, as they always were, or as bytes:
+a header with codec and dictionary ids followed by the compressed JSON. Both
+forms can be mixed in one table, reads decode whichever they get.
+"""
+
+import re
+import struct
+import zlib
+from collections import Counter
+from typing import Iterable
+
+from settings import settings
+
+# imported on first use of zstd, keeps it out of application startup
+zstandard = False
+
+
+def _import_zstandard():
+    global zstandard
+    if zstandard is False:
+        try:
+            import zstandard as module
+        except ImportError:
+            module = None
+        zstandard = module
+    if zstandard is None:
+        raise RuntimeError("zstd storage codec needs zstandard package")
+    return zstandard
+
+
+def zstd_available() -> bool:
+    try:
+        _import_zstandard()
+    except RuntimeError:
+        return False
+    return True
+
+
+ZLIB, ZSTD = 1, 2
+CODECS = {"zlib": ZLIB, "zstd": ZSTD}
+# codec id, dictionary id (0 for the built-in one of zlib, none for zstd)
+HEADER = struct.Struct("<BH")
+LEVELS = {ZLIB: 9, ZSTD: 9}
+
+# strings repeated in every ipstack response, in the order it sends them;
+# zlib finds the most useful matches near the end of the dictionary
+BUILTIN_DICTIONARY = (
+    '"continent_name":"Asia","continent_name":"Africa","continent_name":"Oceania",'
+    '"continent_name":"South America","continent_name":"North America",'
+    '"continent_name":"Europe","country_name":"United Kingdom","country_name":'
+    '"Germany","country_name":"United States","calling_code":"44","calling_code":"49",'
+    '{"code":"de","name":"German","native":"Deutsch"}'
+    '{"ip":"","type":"ipv6","type":"ipv4","continent_code":"EU","continent_code":"NA",'
+    '"continent_name":"North America","country_code":"US","country_name":'
+    '"United States","region_code":"CA","region_name":"California","city":"","zip":"",'
+    '"latitude":,"longitude":,"msa":null,"dma":null,"radius":"0","radius":null,'
+    '"ip_routing_type":"fixed","ip_routing_type":null,"connection_type":"tx",'
+    '"connection_type":null,"location":{"geoname_id":null,"geoname_id":,"capital":'
+    '"Washington D.C.","languages":[{"code":"en","name":"English","native":"English"}],'
+    '"country_flag":"https://assets.ipstack.com/flags/us.svg","country_flag_emoji":'
+    '"🇺🇸","country_flag_emoji_unicode":"U+1F1FA U+1F1F8",'
+    '"calling_code":"1","is_eu":false},"is_eu":true}}'
+).encode()
+# "key":value pairs of a JSON document, including the opening brace
+FRAGMENT = re.compile(rb'[{,]"[^"]*":(?:"(?:[^"\\]|\\.)*"|[^,{}\[\]]*)')
+
+
+class StorageCodec:
+    """Encodes JSON documents to their stored form and decodes them back.
+
+    Writes use `codec` ("none", "zlib" or "zstd") with `dictionary`, reads
+    decode rows written with any codec and dictionary registered before.
+    Documents that would not get smaller are stored as text.
+    """
+
+    def __init__(self, codec: str, dictionary: int):
+        self.codec = codec
+        self.dictionary = dictionary
+        # (codec id, dictionary id) -> dictionary
+        self._dictionaries: dict[tuple[int, int], bytes] = {
+            (ZLIB, 0): BUILTIN_DICTIONARY
+        }
+        self._zstd: dict[tuple[str, int], object] = {}
+
+    def register(self, dictionary: int, codec: str, data: bytes):
+        self._dictionaries[CODECS[codec], dictionary] = data
+        self._zstd.pop(("compress", dictionary), None)
+        self._zstd.pop(("decompress", dictionary), None)
+
+    def load(self, rows: Iterable[tuple[int, str, bytes]]):
+        """Register (id, codec, data) rows of storage_dictionary table."""
+        for dictionary, codec, data in rows:
+            self.register(dictionary, codec, data)
+
+    def check(self):
+        """Raise when documents cannot be written with configured codec."""
+        if self.codec == "none":
+            return
+        if self.codec not in CODECS:
+            raise ValueError(f"Unknown storage codec {self.codec}")
+        if self.codec == "zstd":
+            _import_zstandard()
+        if self.dictionary:
+            self._dictionary(CODECS[self.codec], self.dictionary)
+
+    def encode(self, text: str) -> str | bytes:
+        if self.codec == "none":
+            return text
+        data = text.encode()
+        codec = CODECS[self.codec]
+        if codec == ZLIB:
+            compressor = zlib.compressobj(
+                LEVELS[ZLIB], wbits=-15, zdict=self._dictionary(ZLIB, self.dictionary)
+            )
+            compressed = compressor.compress(data) + compressor.flush()
+        else:
+            compressed = self._zstd_for("compress", self.dictionary).compress(data)
+        if HEADER.size + len(compressed) >= len(data):
+            return text
+        return HEADER.pack(codec, self.dictionary) + compressed
+
+    def decode(self, value: str | bytes) -> bytes:
+        """Return stored document as JSON encoded to utf-8."""
+        if isinstance(value, str):
+            return value.encode()
+        codec, dictionary = HEADER.unpack_from(value)
+        data = memoryview(value)[HEADER.size :]
+        if codec == ZLIB:
+            decompressor = zlib.decompressobj(
+                wbits=-15, zdict=self._dictionary(ZLIB, dictionary)
+            )
+            return decompressor.decompress(data) + decompressor.flush()
+        if codec == ZSTD:
+            return self._zstd_for("decompress", dictionary).decompress(data)
+        raise ValueError(f"Unknown storage codec id {codec}")
+
+    def _dictionary(self, codec: int, dictionary: int) -> bytes:
+        try:
+            return self._dictionaries[codec, dictionary]
+        except KeyError:
+            raise LookupError(
+                f"Storage dictionary {dictionary} is not loaded"
+            ) from None
+
+    def _zstd_for(self, kind: str, dictionary: int):
+        # compressors keep their state between calls, one per dictionary
+        zstd = self._zstd.get((kind, dictionary))
+        if zstd is None:
+            zstandard = _import_zstandard()
+            options = {}
+            if dictionary:
+                data = self._dictionary(ZSTD, dictionary)
+                options["dict_data"] = zstandard.ZstdCompressionDict(data)
+            if kind == "compress":
+                zstd = zstandard.ZstdCompressor(level=LEVELS[ZSTD], **options)
+            else:
+                zstd = zstandard.ZstdDecompressor(**options)
+            self._zstd[kind, dictionary] = zstd
+        return zstd
+
+
+def train_dictionary(codec: str, samples: list[bytes], size: int) -> bytes:
+    """Build dictionary of at most size bytes from sample documents."""
+    if codec == "zstd":
+        return _import_zstandard().train_dictionary(size, samples).as_bytes()
+    # zlib has no trainer: fragments are scored by bytes they would save and
+    # the best ones are kept in their usual order in documents, so that
+    # neighbouring keys are matched at once
+    counts, positions = Counter(), Counter()
+    for sample in samples:
+        for position, fragment in enumerate(FRAGMENT.findall(sample)):
+            counts[fragment] += 1
+            positions[fragment] += position
+    scored = sorted(
+        (fragment for fragment, count in counts.items() if count > 1),
+        key=lambda fragment: counts[fragment] * len(fragment),
+        reverse=True,
+    )
+    chosen, total = [], 0
+    for fragment in scored:
+        if total + len(fragment) > min(size, 32 * 1024):
+            break
+        chosen.append(fragment)
+        total += len(fragment)
+    chosen.sort(key=lambda fragment: positions[fragment] / counts[fragment])
+    return b"".join(chosen)
+
+
+storage_codec = StorageCodec(settings.storage_codec, settings.storage_dictionary)
@@ -1,17 +1,29 @@
+import json
 import pytest
 import asyncio
+import socket
 from fastapi.testclient import TestClient
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app import app
-from database import Base
-from utils import get_db
+from database import Base, create_engine
+from manage import main, sync_engine
+from utils import (
+    get_db,
+    get_read_db,
+    geo_cache,
+    network_index,
+    read_limiter,
+    write_limiter,
+)
+from utils.locator import locator
+from utils.resolver import resolver
 from models import GeoLocation
-from unittest.mock import patch, Mock
+from unittest.mock import patch
 
 DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_engine(DATABASE_URL)
 TestingSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -39,6 +51,14 @@ def client(test_session):
             yield session
 
     app.dependency_overrides[get_db] = mock_of_get_db
+    app.dependency_overrides[get_read_db] = mock_of_get_db
+    geo_cache.clear()
+    resolver.clear()
+    network_index.clear()
+    read_limiter.clear()
+    write_limiter.clear()
+    locator.breaker.reset()
+    locator.limiter.reset()
     yield TestClient(app)
     app.dependency_overrides.clear()
 
@@ -70,21 +90,24 @@ def mock_locator(url_to_geo_locations, url_to_ip_and_ipstack_resp):
         url_to_ip[url] = ip
         ip_to_ipstack_resp[ip] = ipstack_resp
 
-    def mock_ipstack_get_location(ip: str):
-        return ip_to_ipstack_resp.get(ip, None)
+    async def mock_ipstack_get_location(_, *ips: str):
+        if len(ips) == 1:
+            return ip_to_ipstack_resp.get(ips[0], None)
+        return [ip_to_ipstack_resp[ip] for ip in ips if ip in ip_to_ipstack_resp]
 
-    def mock_socket_gethostbyname(url: str):
-        return url_to_ip.get(url, None)
+    async def mock_resolver_query(_, url: str):
+        if url not in url_to_ip:
+            raise socket.gaierror
+        return [url_to_ip[url]], 60.0
 
-    ipstack_lookup_mock = Mock()
-    ipstack_lookup_mock.get_location = mock_ipstack_get_location
     with patch(
-        "utils.locator.socket.gethostbyname", new=mock_socket_gethostbyname
-    ) as socket_mock, patch(
-        "utils.locator.GeoLookup", return_value=ipstack_lookup_mock
-    ) as lookup_mock:
+        "utils.resolver.Resolver._query", new=mock_resolver_query
+    ) as resolver_mock, patch(
+        "utils.ipstack_client.IpstackClient.get_location",
+        new=mock_ipstack_get_location,
+    ) as ipstack_mock:
 
-        yield socket_mock, lookup_mock
+        yield resolver_mock, ipstack_mock
 
 
 @pytest.fixture()
@@ -199,3 +222,23 @@ def url_to_geo_locations() -> dict[str, GeoLocation]:
             },
         ),
     }
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    # file database for manage.py commands, which run on sync engine
+    url = f"sqlite:///{tmp_path / 'manage.db'}"
+    engine = sync_engine(url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return url
+
+
+def write_ndjson(path, *documents):
+    path.write_text("".join(json.dumps(document) + "\n" for document in documents))
+    return str(path)
+
+
+def load(database_url, tmp_path, *documents):
+    path = write_ndjson(tmp_path / "dump.ndjson", *documents)
+    main(["--database-url", database_url, "import", path])
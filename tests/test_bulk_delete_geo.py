@@ -0,0 +1,79 @@
+import asyncio
+from sqlalchemy import select
+from models import GeoLocation
+from utils import geo_cache
+
+
+def store(test_session, *ips):
+    async def add():
+        test_session.add_all(
+            [GeoLocation(ip=ip, ipstack_response={"ip": ip}) for ip in ips]
+        )
+        await test_session.commit()
+
+    asyncio.run(add())
+
+
+def pull_ips(test_session):
+    result = asyncio.run(test_session.execute(select(GeoLocation.ip)))
+    return set(result.scalars())
+
+
+def test_bulk_delete_removes_locations_of_ips_and_urls(
+    client, test_data, mock_locator, url_to_geo_locations, test_session
+):
+    url = "google.com"
+    ip = url_to_geo_locations["unknown.address.com"].ip
+
+    response = client.post(
+        "/geo/bulk-delete", json={"ips": [ip, "1.2.3.4"], "urls": [url, "not.found"]}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"deleted": 2}
+    assert pull_ips(test_session) == set()
+
+
+def test_bulk_delete_removes_every_location_of_network(
+    client, test_session, mock_locator
+):
+    store(
+        test_session,
+        "10.1.0.0",
+        "10.1.200.7",
+        "10.1.255.255",
+        "10.2.0.0",
+        "10.0.255.255",
+        "2001:db8::1",
+        "a01:100::1",
+    )
+    for ip in ("10.1.200.7", "10.2.0.0"):
+        assert client.get("/geo", params={"ip": ip}).status_code == 200
+
+    response = client.post("/geo/bulk-delete", json={"network": "10.1.0.0/16"})
+
+    assert response.json() == {"deleted": 3}
+    # ipv6 address with the same leading bytes is kept
+    assert pull_ips(test_session) == {
+        "10.2.0.0",
+        "10.0.255.255",
+        "2001:db8::1",
+        "a01:100::1",
+    }
+    assert geo_cache.get("10.1.200.7") is None
+    assert geo_cache.get("10.2.0.0") is not None
+    assert client.get("/geo", params={"ip": "10.1.200.7"}).status_code == 404
+
+    response = client.post("/geo/bulk-delete", json={"network": "2001:db8::/32"})
+    assert response.json() == {"deleted": 1}
+
+
+def test_bulk_delete_returns_400_for_invalid_request(client, test_data, mock_locator):
+    both = client.post(
+        "/geo/bulk-delete", json={"ips": [test_data[0].ip], "network": "10.0.0.0/8"}
+    )
+    empty = client.post("/geo/bulk-delete", json={})
+
+    assert both.status_code == 400
+    assert both.json() == {"message": "Provide either ips/urls or network (not both)"}
+    assert empty.status_code == 400
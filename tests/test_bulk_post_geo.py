@@ -0,0 +1,84 @@
+import asyncio
+import httpx
+from unittest.mock import AsyncMock, patch
+from models import GeoLocation
+from sqlalchemy import select
+
+
+def test_post_geo_bulk_reports_created_existing_and_failed_items(
+    client, test_data, mock_locator, url_to_ip_and_ipstack_resp, test_session
+):
+    url, (new_ip, ipstack_resp) = list(url_to_ip_and_ipstack_resp.items())[0]
+    existing_ip = test_data[0].ip
+    response = client.post(
+        "/geo/bulk",
+        json=[
+            {"url": url},
+            {"ip": existing_ip},
+            {"ip": "1.1.1.1"},
+            {"url": "not.existing.url"},
+        ],
+    )
+
+    assert response.status_code == 200
+    assert response.json()["results"] == {
+        url: {"status": 201, "data": ipstack_resp},
+        existing_ip: {"status": 409, "message": "Geo location already exist"},
+        "1.1.1.1": {"status": 400, "message": "Could not find data for given address"},
+        "not.existing.url": {"status": 400, "message": "Could not resolve URL to IP"},
+    }
+    result = asyncio.run(
+        test_session.execute(select(GeoLocation).where(GeoLocation.ip == new_ip))
+    )
+    assert result.scalars().first().ipstack_response == ipstack_resp
+
+
+def test_post_geo_bulk_reports_duplicated_address_once_as_created(
+    client, test_data, mock_locator, url_to_ip_and_ipstack_resp
+):
+    url, (ip, _) = list(url_to_ip_and_ipstack_resp.items())[0]
+    response = client.post("/geo/bulk", json=[{"ip": ip}, {"url": url}])
+
+    results = response.json()["results"]
+    assert results[ip]["status"] == 201
+    assert results[url] == {"status": 409, "message": "Geo location already exist"}
+
+
+def test_post_geo_bulk_uses_ipstack_bulk_lookup_when_enabled(
+    client, test_data, mock_locator, url_to_ip_and_ipstack_resp
+):
+    ip, ipstack_resp = list(url_to_ip_and_ipstack_resp.values())[0]
+    _, get_location = mock_locator
+    calls = []
+
+    async def bulk_get_location(client, *ips: str):
+        calls.append(ips)
+        return await get_location(client, *ips)
+
+    with patch("utils.locator.settings.ipstack_bulk_size", 50), patch(
+        "utils.ipstack_client.IpstackClient.get_location", new=bulk_get_location
+    ):
+        response = client.post("/geo/bulk", json=[{"ip": ip}, {"ip": "1.1.1.1"}])
+
+    assert calls == [("1.1.1.1", ip)]
+    assert response.json()["results"][ip]["status"] == 201
+    assert response.json()["results"]["1.1.1.1"]["status"] == 400
+
+
+def test_post_geo_bulk_returns_400_for_item_with_ip_and_url(client, test_data):
+    response = client.post("/geo/bulk", json=[{"ip": "1.1.1.1", "url": "a.com"}])
+
+    assert response.json()["results"] == {
+        "1.1.1.1": {"status": 400, "message": "Provide either ip or url (not both)"}
+    }
+
+
+def test_post_geo_bulk_returns_503_when_ipstack_is_unreachable(client, test_data):
+    failing = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+
+    with patch("utils.ipstack_client.IpstackClient.get_location", failing):
+        response = client.post("/geo/bulk", json=[{"ip": "1.1.1.1"}])
+
+    # the address may exist, it is not reported as not found
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
@@ -0,0 +1,66 @@
+from unittest.mock import patch
+from utils import GeoDocument, GeoLocationCache, geo_cache
+
+
+def document(ip):
+    return GeoDocument(f'{{"ip":"{ip}"}}'.encode(), ip, None)
+
+
+def test_cache_evicts_least_recently_used_entry():
+    cache = GeoLocationCache(max_entries=2, max_bytes=1024, ttl=60)
+    cache.put("1.1.1.1", document("1.1.1.1"))
+    cache.put("2.2.2.2", document("2.2.2.2"))
+    cache.get("1.1.1.1")
+
+    cache.put("3.3.3.3", document("3.3.3.3"))
+
+    assert cache.get("2.2.2.2") is None
+    assert cache.get("1.1.1.1") == document("1.1.1.1")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_evicts_when_memory_cap_is_exceeded():
+    cache = GeoLocationCache(max_entries=10, max_bytes=30, ttl=60)
+    cache.put("1.1.1.1", document("1.1.1.1"))
+    cache.put("2.2.2.2", document("2.2.2.2"))
+
+    assert cache.get("1.1.1.1") is None
+    assert cache.stats()["bytes"] <= 30
+
+
+def test_cache_expires_entries_after_ttl():
+    cache = GeoLocationCache(max_entries=10, max_bytes=1024, ttl=60)
+    with patch("utils.cache.time.monotonic", return_value=100.0):
+        cache.put("1.1.1.1", document("1.1.1.1"))
+    with patch("utils.cache.time.monotonic", return_value=161.0):
+        assert cache.get("1.1.1.1") is None
+
+
+def test_get_geo_serves_repeated_reads_from_cache(client, test_data, mock_locator):
+    ip = test_data[0].ip
+    client.get("/geo", params={"ip": ip})
+
+    with patch("app.pull_documents_from_db") as pull_mock:
+        response = client.get("/geo", params={"ip": ip})
+
+    assert response.status_code == 200
+    assert response.json() == test_data[0].ipstack_response
+    pull_mock.assert_not_called()
+    assert client.get("/cache/stats").json()["hits"] == 1
+
+
+def test_get_geo_miss_probes_cache_once(client, test_data, mock_locator):
+    client.get("/geo", params={"ip": test_data[0].ip})
+
+    assert client.get("/cache/stats").json()["misses"] == 1
+
+
+def test_delete_geo_invalidates_cached_entry(client, test_data, mock_locator):
+    ip = test_data[0].ip
+    client.get("/geo", params={"ip": ip})
+    assert geo_cache.stats()["entries"] == 1
+
+    client.delete("/geo", params={"ip": ip})
+    response = client.get("/geo", params={"ip": ip})
+
+    assert response.status_code == 404
@@ -77,10 +77,41 @@ def test_delete_geo_returns_400_when_accessing_not_existing_url(
 def test_delete_geo_returns_400_when_socket_returns_error(
     client, test_data, url_to_geo_locations
 ):
-    with patch("utils.locator.socket.gethostbyname", side_effect=socket.gaierror):
+    with patch("utils.resolver.Resolver._query", side_effect=socket.gaierror):
         ip = test_data[0].ip
         url = [url for url, gloc in url_to_geo_locations.items() if gloc.ip == ip][0]
         response = client.delete("/geo", params={"url": url})
 
         assert response.status_code == 400
         assert response.json() == {"message": "Could not resolve URL to IP"}
+
+
+def test_delete_geo_with_matching_if_match_deletes_data(
+    client, test_data, mock_locator
+):
+    geo_location = test_data[0]
+    response = client.delete(
+        "/geo",
+        params={"ip": geo_location.ip},
+        headers={"If-Match": f'"{geo_location.etag}"'},
+    )
+
+    assert response.status_code == 204
+
+
+def test_delete_geo_with_stale_if_match_returns_412(
+    client, test_data, mock_locator, test_session
+):
+    geo_location = test_data[0]
+    response = client.delete(
+        "/geo", params={"ip": geo_location.ip}, headers={"If-Match": '"stale"'}
+    )
+
+    assert response.status_code == 412
+    assert response.json() == {"message": "Geo location was modified"}
+    result = asyncio.run(
+        test_session.execute(
+            select(GeoLocation).where(GeoLocation.ip == geo_location.ip)
+        )
+    )
+    assert result.scalars().first() is not None
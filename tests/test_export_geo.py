@@ -0,0 +1,65 @@
+import gzip
+import json
+import pytest
+from unittest.mock import patch
+
+
+def read_lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_export_geo_streams_every_row_as_ndjson(client, test_data):
+    response = client.get("/geo/export")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert read_lines(response) == [
+        {"id": gloc.id, "ip": gloc.ip, "ipstack_response": gloc.ipstack_response}
+        for gloc in sorted(test_data, key=lambda gloc: gloc.id)
+    ]
+
+
+def test_export_geo_is_gzip_compressed_when_accepted(client, test_data):
+    with client.stream(
+        "GET", "/geo/export", headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        body = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(gzip.decompress(body).splitlines()) == len(test_data)
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip;q=0", "br, gzip; q=0.0", "deflate"])
+def test_export_geo_is_not_compressed_when_gzip_is_refused(
+    client, test_data, accept_encoding
+):
+    response = client.get("/geo/export", headers={"Accept-Encoding": accept_encoding})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert len(read_lines(response)) == len(test_data)
+
+
+def test_export_geo_resumes_after_given_id(client, test_data):
+    first_id = min(gloc.id for gloc in test_data)
+    response = client.get("/geo/export", params={"after": first_id})
+
+    assert [line["id"] for line in read_lines(response)] == sorted(
+        gloc.id for gloc in test_data if gloc.id > first_id
+    )
+
+
+def test_export_geo_filters_by_family(client, test_data):
+    assert len(read_lines(client.get("/geo/export", params={"family": 4}))) == len(
+        test_data
+    )
+    assert client.get("/geo/export", params={"family": 6}).text == ""
+
+
+def test_export_geo_fetches_rows_in_chunks(client, test_data):
+    with patch("app.settings.export_chunk_size", 1):
+        response = client.get("/geo/export", headers={"Accept-Encoding": "identity"})
+
+    assert len(read_lines(response)) == len(test_data)
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,99 @@
+import asyncio
+from app import load_networks
+from models import GeoNetwork
+from utils import PrefixIndex
+from tests.conftest import TestingSessionLocal
+
+
+def test_prefix_index_returns_longest_matching_network():
+    index = PrefixIndex()
+    index.insert("10.0.0.0/8", "wide")
+    index.insert("10.1.0.0/16", "narrow")
+    index.insert("2001:db8::/32", "v6")
+
+    assert index.lookup("10.1.2.3")[1] == "narrow"
+    assert index.lookup("10.2.0.1")[1] == "wide"
+    assert index.lookup("2001:db8::1")[1] == "v6"
+    assert index.lookup("11.0.0.1") is None
+
+    assert index.remove("10.1.0.0/16")
+    assert index.lookup("10.1.2.3")[1] == "wide"
+    assert len(index) == 2
+
+
+def test_get_geo_falls_back_to_covering_network(client, test_data, mock_locator):
+    stored = test_data[0]
+    network = stored.ip.rsplit(".", 1)[0] + ".0/24"
+    response = client.post("/geo/network", json={"network": network, "ip": stored.ip})
+    assert response.status_code == 201
+
+    neighbour = stored.ip.rsplit(".", 1)[0] + ".7"
+    response = client.get("/geo", params={"ip": neighbour})
+
+    assert response.status_code == 200
+    assert response.json() == stored.ipstack_response
+    assert response.headers["X-Geo-Network"] == network
+
+
+def test_post_geo_network_returns_409_when_network_exists(
+    client, test_data, mock_locator
+):
+    stored = test_data[0]
+    body = {"network": stored.ip + "/32"}
+    client.post("/geo/network", json=body)
+
+    response = client.post("/geo/network", json=body)
+
+    assert response.status_code == 409
+    assert response.json() == {"message": "Geo network already exist"}
+
+
+def test_post_geo_network_returns_400_when_ip_is_outside_network(
+    client, test_data, mock_locator
+):
+    response = client.post(
+        "/geo/network", json={"network": "10.0.0.0/8", "ip": test_data[0].ip}
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {"message": "Ip has to belong to the network"}
+
+
+def test_delete_geo_network_stops_fallback(client, test_data, mock_locator):
+    stored = test_data[0]
+    network = stored.ip.rsplit(".", 1)[0] + ".0/24"
+    client.post("/geo/network", json={"network": network, "ip": stored.ip})
+
+    response = client.delete("/geo/network", params={"network": network})
+    assert response.status_code == 204
+
+    neighbour = stored.ip.rsplit(".", 1)[0] + ".7"
+    assert client.get("/geo", params={"ip": neighbour}).status_code == 404
+    assert client.delete("/geo/network", params={"network": network}).status_code == 404
+
+
+def test_networks_written_by_other_workers_are_reloaded(client, test_session):
+    network = GeoNetwork(
+        network="10.1.0.0", prefix_length=16, ipstack_response={"city": "Ten"}
+    )
+
+    async def reload(known, change=None):
+        # change is made as by another worker, this one only reloads
+        async with TestingSessionLocal() as db:
+            if change == "add":
+                db.add(network)
+            elif change == "delete":
+                await db.delete(network)
+            await db.commit()
+            return await load_networks(db, known)
+
+    known = asyncio.run(reload(frozenset(), "add"))
+    found = client.get("/geo", params={"ip": "10.1.2.3"})
+    unchanged = asyncio.run(reload(known))
+    asyncio.run(reload(known, "delete"))
+    removed = client.get("/geo", params={"ip": "10.1.2.3"})
+
+    assert found.json() == {"city": "Ten"}
+    assert found.headers["X-Geo-Network"] == "10.1.0.0/16"
+    assert unchanged == known
+    assert removed.status_code == 404
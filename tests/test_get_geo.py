@@ -1,5 +1,11 @@
+import asyncio
 import socket
 from unittest.mock import patch
+from models import GeoLocation
+from database import dumps_json
+from storage_codec import storage_codec
+from utils import geo_cache
+from sqlalchemy import select, text
 
 
 def test_get_geo_returns_ipstack_response_by_ip(client, test_data, mock_locator):
@@ -62,10 +68,164 @@ def test_get_geo_returns_400_when_accessing_not_existing_url(
 def test_get_geo_returns_400_when_socket_returns_error(
     client, test_data, url_to_geo_locations
 ):
-    with patch("utils.locator.socket.gethostbyname", side_effect=socket.gaierror):
+    with patch("utils.resolver.Resolver._query", side_effect=socket.gaierror):
         ip = "198.51.111.42"
         url = [url for url, gloc in url_to_geo_locations.items() if gloc.ip == ip][0]
         response = client.get("/geo", params={"url": url})
 
         assert response.status_code == 400
         assert response.json() == {"message": "Could not resolve URL to IP"}
+
+
+def test_get_geo_matches_ipv4_mapped_ipv6_address(client, test_data, mock_locator):
+    gloc_to_be_found = test_data[0]
+    response = client.get("/geo", params={"ip": f"::ffff:{gloc_to_be_found.ip}"})
+
+    assert response.status_code == 200
+    assert response.json() == gloc_to_be_found.ipstack_response
+
+
+def test_geo_location_stores_canonical_packed_ip(test_session):
+    async def add_and_query():
+        test_session.add(GeoLocation(ip="0:0:0:0:0:0:0:1", ipstack_response={}))
+        await test_session.commit()
+        stored = await test_session.execute(
+            text("SELECT hex(ip), family FROM geo_location")
+        )
+        query = select(GeoLocation).where(GeoLocation.ip == "::1")
+        return stored.one(), (await test_session.execute(query)).scalars().one()
+
+    stored, geo_location = asyncio.run(add_and_query())
+
+    assert tuple(stored) == ("0" * 31 + "1", 6)
+    assert geo_location.ip == "::1"
+
+
+def test_get_geo_returns_document_as_stored(
+    client, test_data, mock_locator, url_to_ip_and_ipstack_resp
+):
+    ip, ipstack_resp = list(url_to_ip_and_ipstack_resp.values())[0]
+    client.post("/geo", json={"ip": ip})
+    geo_cache.clear()
+
+    response = client.get("/geo", params={"ip": ip})
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == dumps_json(ipstack_resp).encode()
+
+
+def test_get_geo_returns_validators(client, test_data, mock_locator):
+    geo_location = test_data[0]
+    response = client.get("/geo", params={"ip": geo_location.ip})
+
+    assert response.headers["etag"] == f'"{geo_location.etag}"'
+    assert response.headers["cache-control"] == "max-age=60"
+    assert response.headers["last-modified"].endswith("GMT")
+
+
+def test_get_geo_returns_not_modified_for_matching_etag(
+    client, test_data, mock_locator
+):
+    geo_location = test_data[0]
+    etag = f'"{geo_location.etag}"'
+
+    # first request revalidates against database, second one against cache
+    for _ in range(2):
+        response = client.get(
+            "/geo", params={"ip": geo_location.ip}, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+
+def test_get_geo_returns_document_for_stale_etag(client, test_data, mock_locator):
+    geo_location = test_data[0]
+    response = client.get(
+        "/geo", params={"ip": geo_location.ip}, headers={"If-None-Match": '"stale"'}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == geo_location.ipstack_response
+
+
+FIELDS = "country_code,city,latitude,location.capital,location.is_eu,location.languages"
+
+
+def test_get_geo_returns_selected_fields_picked_by_database(
+    client, test_data, mock_locator, url_to_ip_and_ipstack_resp
+):
+    ip, ipstack_resp = list(url_to_ip_and_ipstack_resp.values())[0]
+    client.post("/geo", json={"ip": ip})
+    geo_cache.clear()
+
+    with patch("app.pull_document_from_db", side_effect=AssertionError):
+        response = client.get("/geo", params={"ip": ip, "fields": FIELDS})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "country_code": "US",
+        "city": "San Francisco",
+        "latitude": ipstack_resp["latitude"],
+        "location": {
+            "capital": "Washington D.C.",
+            "is_eu": False,
+            "languages": [{"code": "en", "name": "English", "native": "English"}],
+        },
+    }
+
+
+def test_get_geo_selects_same_fields_from_cache_and_compressed_rows(
+    client, test_data, mock_locator, url_to_ip_and_ipstack_resp
+):
+    ip, _ = list(url_to_ip_and_ipstack_resp.values())[0]
+    with patch.object(storage_codec, "codec", "zlib"):
+        client.post("/geo", json={"ip": ip})
+    params = {"ip": ip, "fields": f"{FIELDS},msa,time_zone"}
+
+    cached = client.get("/geo", params=params)
+    geo_cache.clear()
+    compressed = client.get("/geo", params=params)
+    client.delete("/geo", params={"ip": ip})
+    client.post("/geo", json={"ip": ip})
+    geo_cache.clear()
+    text = client.get("/geo", params=params)
+
+    assert cached.json() == compressed.json() == text.json()
+    assert cached.json()["time_zone"] is None
+    assert cached.headers["etag"] == compressed.headers["etag"]
+
+
+def test_get_geo_returns_422_for_unknown_fields(client, test_data, mock_locator):
+    response = client.get(
+        "/geo",
+        params={"ip": test_data[0].ip, "fields": "city,location.size,password"},
+    )
+    empty = client.get("/geo", params={"ip": test_data[0].ip, "fields": " , "})
+
+    assert response.status_code == 422
+    assert response.json() == {"message": "Unknown fields: location.size, password"}
+    assert empty.status_code == 422
+
+
+def test_get_geo_revalidates_selected_fields(client, test_data, mock_locator):
+    geo_location = test_data[1]
+    params = {"ip": geo_location.ip, "fields": "city,location"}
+    response = client.get("/geo", params=params)
+    geo_cache.clear()
+
+    etag = response.headers["etag"]
+    revalidated = client.get("/geo", params=params, headers={"If-None-Match": etag})
+    other_fields = client.get(
+        "/geo",
+        params={"ip": geo_location.ip, "fields": "city"},
+        headers={"If-None-Match": etag},
+    )
+
+    assert etag != f'"{geo_location.etag}"'
+    assert response.json() == {
+        "city": geo_location.ipstack_response["city"],
+        "location": geo_location.ipstack_response["location"],
+    }
+    assert revalidated.status_code == 304
+    assert other_fields.status_code == 200
@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError, StatementError
+from models import GeoLocation
+from utils import GroupCommitWriter
+from tests.conftest import TestingSessionLocal
+
+
+def make_writer(max_delay=0.01, max_batch=100):
+    writer = GroupCommitWriter(TestingSessionLocal, max_delay, max_batch)
+    batches = []
+    insert = writer._insert
+
+    async def recording_insert(rows):
+        batches.append([row["ip"] for row in rows])
+        return await insert(rows)
+
+    writer._insert = recording_insert
+    return writer, batches
+
+
+def row(ip, **response):
+    return {"ip": ip, "ipstack_response": {"ip": ip, **response}}
+
+
+def pull_ips(test_session):
+    result = asyncio.run(test_session.execute(select(GeoLocation.ip)))
+    return set(result.scalars())
+
+
+async def insert_all(writer, *rows):
+    return await asyncio.gather(
+        *[writer.insert(row) for row in rows], return_exceptions=True
+    )
+
+
+def test_concurrent_inserts_share_one_transaction(test_session):
+    writer, batches = make_writer()
+
+    created = asyncio.run(insert_all(writer, row("1.1.1.1"), row("2.2.2.2")))
+
+    assert created == [True, True]
+    assert batches == [["1.1.1.1", "2.2.2.2"]]
+    assert pull_ips(test_session) == {"1.1.1.1", "2.2.2.2"}
+
+
+def test_full_batch_is_written_without_waiting(test_session):
+    writer, batches = make_writer(max_delay=60, max_batch=2)
+
+    rows = [row(f"10.0.0.{n}") for n in range(5)]
+    created = asyncio.run(asyncio.wait_for(insert_all(writer, *rows), 5))
+
+    assert created == [True] * 5
+    # rows queued during a write go with the next batch
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_stored_and_repeated_ips_are_reported_as_duplicates(test_session, test_data):
+    writer, _ = make_writer()
+    stored = test_data[0].ip
+
+    created = asyncio.run(
+        insert_all(writer, row(stored), row("1.1.1.1"), row("1.1.1.1"))
+    )
+
+    assert created == [False, True, False]
+
+
+def test_failing_row_fails_only_its_own_insert(test_session):
+    writer, batches = make_writer()
+
+    created = asyncio.run(
+        insert_all(writer, row("1.1.1.1"), row("2.2.2.2", bad=object()))
+    )
+
+    assert created[0] is True
+    assert isinstance(created[1], StatementError)
+    assert len(batches) == 3
+    assert pull_ips(test_session) == {"1.1.1.1"}
+
+
+@pytest.mark.usefixtures("mock_locator")
+def test_post_geo_with_group_commit(client, test_data):
+    writer, batches = make_writer()
+
+    with patch("app.settings.group_commit_enabled", True), patch(
+        "app.group_commit", writer
+    ):
+        created = client.post("/geo", json={"url": "github.com"})
+        existing = client.post("/geo", json={"ip": "162.159.140.229"})
+        fetched = client.get("/geo", params={"ip": "162.159.140.229"})
+
+    assert created.status_code == 201
+    assert created.json()["ip"] == "162.159.140.229"
+    assert existing.status_code == 409
+    assert fetched.status_code == 200
+    assert fetched.json() == created.json()
+    assert batches == [["162.159.140.229"]]
+
+
+def test_failed_transaction_fails_whole_batch_without_retries(test_session):
+    writer, batches = make_writer()
+    locked = OperationalError("INSERT", {}, Exception("database is locked"))
+
+    async def locked_insert(rows):
+        batches.append([row["ip"] for row in rows])
+        raise locked
+
+    writer._insert = locked_insert
+    created = asyncio.run(insert_all(writer, row("1.1.1.1"), row("2.2.2.2")))
+
+    assert created == [locked, locked]
+    assert batches == [["1.1.1.1", "2.2.2.2"]]
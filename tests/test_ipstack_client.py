@@ -0,0 +1,95 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from utils import IpstackClient, IpstackError, IpstackUnavailable
+
+
+def get_location_with(handler, *ips: str):
+    client = IpstackClient(
+        access_key="key",
+        base_url="http://api.ipstack.test",
+        connect_timeout=1,
+        read_timeout=1,
+        max_in_flight=2,
+        retries=2,
+        retry_backoff=0,
+    )
+
+    async def get_location():
+        http_client = httpx.AsyncClient(
+            base_url=client.base_url, transport=httpx.MockTransport(handler)
+        )
+        with patch.object(client, "_get_client", return_value=http_client):
+            return await client.get_location(*ips)
+
+    return asyncio.run(get_location())
+
+
+def test_ipstack_client_retries_retryable_statuses():
+    statuses = [503, 429, 200]
+
+    def handler(request: httpx.Request):
+        assert request.url.params["access_key"] == "key"
+        return httpx.Response(statuses.pop(0), json={"ip": "1.1.1.1"})
+
+    assert get_location_with(handler, "1.1.1.1") == {"ip": "1.1.1.1"}
+    assert statuses == []
+
+
+def test_ipstack_client_retries_transport_errors_until_limit():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        get_location_with(handler, "1.1.1.1")
+    assert len(calls) == 3
+
+
+def test_ipstack_client_raises_error_reported_in_body():
+    def handler(_: httpx.Request):
+        return httpx.Response(200, json={"error": {"info": "invalid key"}})
+
+    with pytest.raises(IpstackError, match="invalid key"):
+        get_location_with(handler, "1.1.1.1")
+
+
+def test_ipstack_client_sends_many_ips_in_one_bulk_request():
+    def handler(request: httpx.Request):
+        assert request.url.path == "/1.1.1.1,2.2.2.2"
+        return httpx.Response(200, json=[{"ip": "1.1.1.1"}, {"ip": "2.2.2.2"}])
+
+    assert get_location_with(handler, "1.1.1.1", "2.2.2.2") == [
+        {"ip": "1.1.1.1"},
+        {"ip": "2.2.2.2"},
+    ]
+
+
+def test_ipstack_client_does_not_back_off_after_last_attempt():
+    def handler(_: httpx.Request):
+        return httpx.Response(503)
+
+    with patch("utils.ipstack_client.asyncio.sleep") as sleep:
+        with pytest.raises(IpstackUnavailable):
+            get_location_with(handler, "1.1.1.1")
+    assert sleep.call_count == 2
+
+
+def test_ipstack_client_raises_retryable_status_left_after_retries():
+    def handler(_: httpx.Request):
+        return httpx.Response(429, headers={"Retry-After": "7"})
+
+    with pytest.raises(IpstackUnavailable) as error:
+        get_location_with(handler, "1.1.1.1")
+    assert error.value.status_code == 429
+    assert error.value.retry_after == 7.0
+
+
+def test_ipstack_client_returns_none_for_other_statuses():
+    def handler(_: httpx.Request):
+        return httpx.Response(404)
+
+    assert get_location_with(handler, "1.1.1.1") is None
@@ -0,0 +1,139 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from utils import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    IpstackUnavailable,
+    Locator,
+    UpstreamUnavailable,
+)
+from utils.locator import locator
+
+
+def make_breaker(**options):
+    return CircuitBreaker(
+        **{
+            "failure_ratio": 0.5,
+            "window": 4,
+            "slow_call": 1.0,
+            "open_for": 10.0,
+            "probes": 2,
+            **options,
+        }
+    )
+
+
+def test_breaker_opens_when_failure_ratio_is_reached():
+    breaker = make_breaker()
+    for failed, elapsed in [(False, 0.1), (True, 0.1), (False, 0.1), (False, 5.0)]:
+        breaker.before_call()
+        breaker.record(failed, elapsed)
+
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+
+
+def test_breaker_closes_after_successful_probes():
+    breaker = make_breaker(window=1)
+    breaker.record(True, 0.1)
+
+    with patch("utils.locator.time.monotonic", return_value=breaker._opened_at + 11):
+        assert breaker.state == "half_open"
+        breaker.before_call()
+        breaker.before_call()
+        # only configured number of probes is let through
+        with pytest.raises(UpstreamUnavailable):
+            breaker.before_call()
+        breaker.record(False, 0.1)
+        breaker.record(False, 0.1)
+
+    assert breaker.state == "closed"
+
+
+def test_limiter_increases_additively_and_decreases_multiplicatively():
+    limiter = AdaptiveLimiter(
+        initial=4, min_limit=1, max_limit=8, latency_target=1.0, backoff=0.5
+    )
+
+    async def calls():
+        for _ in range(4):
+            await limiter.acquire()
+            limiter.release(False, 0.1)
+        assert limiter.limit == pytest.approx(5, abs=0.1)
+        await limiter.acquire()
+        limiter.release(False, 2.0)
+        assert limiter.limit == pytest.approx(2.5, abs=0.1)
+        assert limiter.in_flight == 0
+
+    asyncio.run(calls())
+
+
+def test_locator_fails_calls_over_deadline():
+    async def slow_location(*_):
+        await asyncio.sleep(1)
+
+    ipstack_client = AsyncMock()
+    ipstack_client.get_location.side_effect = slow_location
+    slow_locator = Locator(
+        ipstack_client,
+        make_breaker(window=1),
+        AdaptiveLimiter(2, 1, 4, latency_target=1.0, backoff=0.5),
+        deadline=0.01,
+    )
+
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(slow_locator.get_location_for("1.1.1.1"))
+    assert slow_locator.breaker.state == "open"
+    assert slow_locator.limiter.in_flight == 0
+
+
+def test_open_circuit_fails_post_fast_and_keeps_get_working(
+    client, test_data, mock_locator
+):
+    with patch.object(locator.breaker, "window", 1):
+        locator.breaker.record(True, 0.1)
+
+    response = client.post("/geo", json={"ip": "162.159.140.229"})
+
+    assert response.status_code == 503
+    assert response.json() == {
+        "message": "Location service is unavailable, try again later."
+    }
+    assert int(response.headers["retry-after"]) > 0
+    assert client.get("/geo", params={"ip": test_data[0].ip}).status_code == 200
+
+
+def test_failing_ipstack_opens_circuit_and_post_gets_503(client, test_data):
+    failing = AsyncMock(side_effect=IpstackUnavailable(503, None))
+
+    with patch.object(locator.ipstack_client, "get_location", failing), patch.object(
+        locator.breaker, "window", 4
+    ):
+        responses = [client.post("/geo", json={"ip": f"10.0.0.{n}"}) for n in range(5)]
+
+    assert {response.status_code for response in responses} == {503}
+    assert locator.breaker.state == "open"
+    assert locator.limiter.limit < locator.limiter.initial
+    # last request was rejected by the circuit, without calling ipstack
+    assert failing.await_count == 4
+
+
+def test_unreachable_ipstack_gets_503_before_circuit_opens(client, test_data):
+    failing = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+
+    with patch.object(locator.ipstack_client, "get_location", failing):
+        response = client.post("/geo", json={"ip": "10.0.0.1"})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert locator.breaker.state == "closed"
+
+
+def test_utils_package_does_not_hide_its_modules():
+    import utils.locator
+
+    assert utils.locator.CircuitBreaker is CircuitBreaker
+    assert utils.locator.locator is locator
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+from app import pull_documents_from_db
+
+
+def test_lookup_geo_returns_result_per_item(
+    client, test_data, mock_locator, url_to_geo_locations
+):
+    ip = test_data[0].ip
+    url = [url for url, gloc in url_to_geo_locations.items() if gloc.ip != ip][0]
+    response = client.post(
+        "/geo/lookup",
+        json={"ips": [ip, "1.1.1.1"], "urls": [url, "not.existing.url"]},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["results"] == {
+        ip: {"status": 200, "data": test_data[0].ipstack_response},
+        "1.1.1.1": {"status": 404, "message": "Location for given ip/url not found"},
+        url: {"status": 200, "data": url_to_geo_locations[url].ipstack_response},
+        "not.existing.url": {"status": 400, "message": "Could not resolve URL to IP"},
+    }
+
+
+def test_lookup_geo_fetches_all_rows_with_single_query(client, test_data, mock_locator):
+    ips = [gloc.ip for gloc in test_data]
+    with patch("app.pull_documents_from_db", wraps=pull_documents_from_db) as pull_mock:
+        response = client.post("/geo/lookup", json={"ips": ips})
+
+    assert response.status_code == 200
+    assert all(r["status"] == 200 for r in response.json()["results"].values())
+    pull_mock.assert_awaited_once()
+
+
+def test_lookup_geo_returns_400_when_too_many_items_are_sent(client, test_data):
+    with patch("app.settings.batch_max_items", 1):
+        response = client.post("/geo/lookup", json={"ips": ["1.1.1.1", "2.2.2.2"]})
+
+    assert response.status_code == 400
+    assert response.json() == {"message": "At most 1 ips/urls can be sent at once"}
+
+
+def test_lookup_geo_returns_400_when_nothing_is_sent(client, test_data):
+    response = client.post("/geo/lookup", json={})
+
+    assert response.status_code == 400
+    assert response.json() == {"message": "Ip or url has to be provided"}
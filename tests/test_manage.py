@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import dumps_json
+from manage import main, sync_engine
+from models import GeoLocation, document_etag
+from tests.conftest import write_ndjson
+
+
+def pull_rows(database_url):
+    engine = sync_engine(database_url)
+    with Session(engine) as db:
+        rows = {row.ip: row for row in db.scalars(select(GeoLocation))}
+    engine.dispose()
+    return rows
+
+
+def test_import_loads_raw_and_exported_documents(database_url, tmp_path):
+    path = write_ndjson(
+        tmp_path / "dump.ndjson",
+        {"ip": "1.1.1.1", "city": "Sydney"},
+        {"id": 7, "ip": "::ffff:8.8.8.8", "ipstack_response": {"city": "Dallas"}},
+        {"ip": "not an ip"},
+    )
+
+    main(["--database-url", database_url, "import", path])
+
+    rows = pull_rows(database_url)
+    assert rows.keys() == {"1.1.1.1", "8.8.8.8"}
+    assert rows["8.8.8.8"].family == 4
+    assert rows["8.8.8.8"].ipstack_response == {"city": "Dallas"}
+    assert rows["1.1.1.1"].etag == document_etag(
+        dumps_json({"ip": "1.1.1.1", "city": "Sydney"}).encode()
+    )
+
+
+@pytest.mark.parametrize("rebuild", [[], ["--rebuild-indexes"]])
+def test_import_skips_existing_ips_by_default(database_url, tmp_path, rebuild):
+    first = write_ndjson(tmp_path / "first.ndjson", {"ip": "1.1.1.1", "city": "A"})
+    second = write_ndjson(tmp_path / "second.ndjson", {"ip": "1.1.1.1", "city": "B"})
+
+    main(["--database-url", database_url, "import", first])
+    main(["--database-url", database_url, "import", second, *rebuild])
+
+    rows = pull_rows(database_url)
+    assert len(rows) == 1
+    assert rows["1.1.1.1"].ipstack_response["city"] == "A"
+
+
+def test_import_updates_changed_documents(database_url, tmp_path):
+    first = write_ndjson(tmp_path / "first.ndjson", {"ip": "1.1.1.1", "city": "A"})
+    second = write_ndjson(tmp_path / "second.ndjson", {"ip": "1.1.1.1", "city": "B"})
+
+    main(["--database-url", database_url, "import", first])
+    main(["--database-url", database_url, "import", second, "--on-conflict", "update"])
+
+    row = pull_rows(database_url)["1.1.1.1"]
+    assert row.ipstack_response["city"] == "B"
+    assert row.version == 2
+
+
+def test_import_reads_csv(database_url, tmp_path):
+    path = tmp_path / "dump.csv"
+    path.write_text('ip,ipstack_response\n2001:db8::1,"{""city"": ""Paris""}"\n')
+
+    main(["--database-url", database_url, "import", str(path), "--format", "csv"])
+
+    row = pull_rows(database_url)["2001:db8::1"]
+    assert row.family == 6
+    assert row.ipstack_response == {"city": "Paris"}
+
+
+def test_import_rejects_lines_without_ip_or_json(database_url, tmp_path, capsys):
+    path = tmp_path / "dump.ndjson"
+    path.write_text(
+        '{"success": false, "error": {"code": 104, "type": "usage_limit_reached"}}\n'
+        '{"ip": "1.1.1.1", "city":\n'
+        '{"ip": "8.8.8.8", "city": "Dallas"}\n'
+    )
+
+    main(["--database-url", database_url, "import", str(path)])
+
+    assert pull_rows(database_url).keys() == {"8.8.8.8"}
+    assert "read 3 rows, written 1, rejected 2" in capsys.readouterr().err
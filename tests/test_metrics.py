@@ -0,0 +1,55 @@
+from unittest.mock import MagicMock, patch
+
+
+def test_get_geo_returns_server_timing_with_phases(
+    client, test_data, mock_locator, url_to_geo_locations
+):
+    url = [url for url, gloc in url_to_geo_locations.items()][0]
+    response = client.get("/geo", params={"url": url})
+
+    assert response.status_code == 200
+    phases = [e.split(";")[0] for e in response.headers["Server-Timing"].split(", ")]
+    # stored document is returned without serialization
+    assert phases == ["dns", "db", "total"]
+
+
+def test_metrics_exposes_latency_histograms_and_gauges(client, test_data, mock_locator):
+    client.get("/geo", params={"ip": test_data[0].ip})
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    assert any(
+        line.startswith(
+            'http_request_duration_seconds_count{method="GET",route="/geo",status="200"}'
+        )
+        for line in lines
+    )
+    assert any(
+        line.startswith(
+            'http_request_phase_duration_seconds_bucket{route="/geo",phase="db",le="+Inf"}'
+        )
+        for line in lines
+    )
+    assert "# TYPE threadpool_busy_threads gauge" in lines
+    assert "# TYPE geo_cache_misses_total counter" in lines
+
+
+def test_metrics_exposes_read_pool_next_to_write_pool(client):
+    pools = {
+        name: MagicMock(
+            **{"pool.size.return_value": size, "pool.checkedout.return_value": 1}
+        )
+        for name, size in [("write", 5), ("read", 10)]
+    }
+
+    with patch("utils.metrics.engine", pools["write"]), patch(
+        "utils.metrics.read_engine", pools["read"]
+    ):
+        lines = client.get("/metrics").text.splitlines()
+
+    assert 'db_pool_size{pool="write"} 5' in lines
+    assert 'db_pool_size{pool="read"} 10' in lines
+    assert 'db_pool_checked_out{pool="read"} 1' in lines
@@ -3,6 +3,7 @@ from unittest.mock import patch
 from models import GeoLocation
 from sqlalchemy import select
 import asyncio
+import httpx
 
 
 def test_post_geo_returns_ipstack_and_adds_data_for_ip(
@@ -93,10 +94,38 @@ def test_post_geo_returns_400_when_accessing_not_existing_url(
 def test_post_geo_returns_400_when_socket_returns_error(
     client, test_data, url_to_geo_locations
 ):
-    with patch("utils.locator.socket.gethostbyname", side_effect=socket.gaierror):
+    with patch("utils.resolver.Resolver._query", side_effect=socket.gaierror):
         ip = test_data[0].ip
         url = [url for url, gloc in url_to_geo_locations.items() if gloc.ip == ip][0]
         response = client.post("/geo", json={"url": url})
 
         assert response.status_code == 400
         assert response.json() == {"message": "Could not resolve URL to IP"}
+
+
+def test_post_geo_concurrent_requests_for_same_ip_share_one_lookup(
+    client, test_data, mock_locator, url_to_ip_and_ipstack_resp
+):
+    ip, ipstack_resp = list(url_to_ip_and_ipstack_resp.values())[0]
+    _, get_location = mock_locator
+    calls = []
+
+    async def slow_get_location(client, ip: str):
+        calls.append(ip)
+        await asyncio.sleep(0.05)
+        return await get_location(client, ip)
+
+    async def post_concurrently():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return await asyncio.gather(
+                *[c.post("/geo", json={"ip": ip}) for _ in range(5)]
+            )
+
+    with patch(
+        "utils.ipstack_client.IpstackClient.get_location", new=slow_get_location
+    ):
+        responses = asyncio.run(post_concurrently())
+
+    assert sorted(r.status_code for r in responses) == [201, 409, 409, 409, 409]
+    assert calls == [ip]
@@ -0,0 +1,47 @@
+from unittest.mock import patch
+from utils import TokenBucketLimiter, read_limiter, write_limiter
+
+
+def test_limiter_allows_burst_and_refills_at_rate():
+    limiter = TokenBucketLimiter(rate=2, burst=3, max_keys=10)
+
+    assert [limiter.acquire("client", now=0) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("client", now=0) == 0.5
+    assert limiter.acquire("other", now=0) == 0
+    assert limiter.acquire("client", now=0.5) == 0
+
+
+def test_limiter_drops_idle_and_least_recently_used_buckets():
+    limiter = TokenBucketLimiter(rate=1, burst=2, max_keys=2)
+    limiter.acquire("a", now=0)
+    limiter.acquire("b", now=0)
+    limiter.acquire("c", now=0)
+
+    assert len(limiter) == 2
+    # refilled buckets are dropped, as they are equal to new ones
+    limiter.acquire("d", now=10)
+    assert len(limiter) == 1
+
+
+def test_rate_limit_returns_429_with_retry_after(client, test_data, mock_locator):
+    ip = test_data[0].ip
+    with patch.object(read_limiter, "burst", 2), patch.object(
+        read_limiter, "rate", 0.1
+    ):
+        responses = [client.get("/geo", params={"ip": ip}) for _ in range(3)]
+
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[2].headers["retry-after"] == "10"
+    assert responses[2].json() == {"message": "Too many requests"}
+
+
+def test_rate_limit_budgets_reads_and_writes_separately(
+    client, test_data, mock_locator
+):
+    ip = test_data[0].ip
+    with patch.object(write_limiter, "burst", 1), patch.object(
+        write_limiter, "rate", 0.1
+    ):
+        client.post("/geo", json={"ip": "1.1.1.1"})
+        assert client.post("/geo", json={"ip": "1.1.1.1"}).status_code == 429
+        assert client.get("/geo", params={"ip": ip}).status_code == 200
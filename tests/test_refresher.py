@@ -0,0 +1,96 @@
+import asyncio
+from unittest.mock import AsyncMock
+from sqlalchemy import select
+from models import GeoLocation
+from utils import Refresher, geo_cache
+from tests.conftest import TestingSessionLocal
+
+
+def make_refresher(get_location_for, max_age=0.0):
+    locator = AsyncMock()
+    locator.get_location_for.side_effect = get_location_for
+    return Refresher(
+        locator,
+        TestingSessionLocal,
+        max_age=max_age,
+        interval=60,
+        rate=1000,
+        batch_size=1,
+    )
+
+
+def pull_rows(test_session):
+    result = asyncio.run(test_session.execute(select(GeoLocation)))
+    return {row.ip: row for row in result.scalars()}
+
+
+def test_refresh_updates_stale_rows_in_place(test_session, test_data):
+    before = {gloc.ip: (gloc.id, gloc.etag, gloc.version) for gloc in test_data}
+    refresher = make_refresher(lambda ip: {"ip": ip, "city": "Refreshed"})
+
+    assert asyncio.run(refresher.refresh_pass()) == len(test_data)
+
+    for ip, row in pull_rows(test_session).items():
+        id, etag, version = before[ip]
+        assert row.id == id
+        assert row.ipstack_response == {"ip": ip, "city": "Refreshed"}
+        assert row.etag != etag
+        assert row.version == version + 1
+        assert row.fetched_at == row.updated_at
+
+
+def test_refresh_keeps_etag_of_unchanged_documents(test_session, test_data):
+    responses = {gloc.ip: gloc.ipstack_response for gloc in test_data}
+    before = {gloc.ip: (gloc.etag, gloc.version, gloc.fetched_at) for gloc in test_data}
+    refresher = make_refresher(responses.get)
+
+    asyncio.run(refresher.refresh_pass())
+
+    for ip, row in pull_rows(test_session).items():
+        etag, version, fetched_at = before[ip]
+        assert (row.etag, row.version) == (etag, version)
+        assert row.fetched_at > fetched_at
+
+
+def test_refresh_skips_fresh_rows_and_failed_lookups(test_session, test_data):
+    fresh = make_refresher(lambda ip: {"ip": ip}, max_age=3600)
+    assert asyncio.run(fresh.refresh_pass()) == 0
+    fresh.locator.get_location_for.assert_not_called()
+
+    failing = make_refresher(Exception("ipstack down"))
+    assert asyncio.run(failing.refresh_pass()) == 0
+    assert failing.locator.get_location_for.call_count == len(test_data)
+
+
+def test_refresh_invalidates_cached_documents(client, test_data, mock_locator):
+    ip = test_data[0].ip
+    client.get("/geo", params={"ip": ip})
+    refresher = make_refresher(lambda ip: {"ip": ip, "city": "Refreshed"})
+
+    asyncio.run(refresher.refresh_pass())
+
+    assert geo_cache.get(ip) is None
+    assert client.get("/geo", params={"ip": ip}).json()["city"] == "Refreshed"
+
+
+def test_only_one_worker_holding_lock_runs_refresher(tmp_path, test_session):
+    holders = []
+    workers = [make_refresher(AsyncMock(), max_age=1e9) for _ in range(2)]
+    for worker in workers:
+        worker.lock_path = str(tmp_path / "refresh.lock")
+        worker.interval = 0.01
+
+    async def run_both():
+        tasks = [asyncio.create_task(worker.run()) for worker in workers]
+        await asyncio.sleep(0.05)
+        holders.append([worker._lock_fd is not None for worker in workers])
+        # lock is released when its holder stops, the other one takes over
+        tasks[0].cancel()
+        await asyncio.sleep(0.05)
+        holders.append([worker._lock_fd is not None for worker in workers])
+        tasks[1].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run_both())
+
+    assert holders == [[True, False], [False, True]]
@@ -0,0 +1,76 @@
+import asyncio
+import socket
+from unittest.mock import patch, AsyncMock
+from utils import Resolver
+
+
+def make_resolver(**kwargs) -> Resolver:
+    options = dict(
+        ipv6=False, default_ttl=60, max_ttl=3600, negative_ttl=5, max_entries=10
+    )
+    options.update(kwargs)
+    return Resolver(**options)
+
+
+def test_resolver_caches_positive_answers():
+    resolver = make_resolver()
+    query = AsyncMock(return_value=(["142.251.98.139"], 60))
+
+    async def resolve_twice():
+        with patch.object(resolver, "_query", query):
+            return [await resolver.resolve("google.com") for _ in range(2)]
+
+    assert asyncio.run(resolve_twice()) == ["142.251.98.139"] * 2
+    query.assert_awaited_once()
+
+
+def test_resolver_caches_negative_answers_for_negative_ttl():
+    resolver = make_resolver()
+    query = AsyncMock(side_effect=socket.gaierror)
+
+    async def resolve_twice():
+        with patch.object(resolver, "_query", query):
+            first = await resolver.resolve("not.existing.url")
+            with patch("utils.resolver.time.monotonic", return_value=10**9):
+                second = await resolver.resolve("not.existing.url")
+            return first, second
+
+    assert asyncio.run(resolve_twice()) == (None, None)
+    assert query.await_count == 2
+
+
+def test_resolver_shares_concurrent_lookups_of_same_hostname():
+    resolver = make_resolver()
+    calls = 0
+
+    async def slow_query(hostname):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["142.251.98.139"], 60
+
+    async def resolve_concurrently():
+        with patch.object(resolver, "_query", slow_query):
+            return await asyncio.gather(
+                *[resolver.resolve("google.com") for _ in range(10)]
+            )
+
+    assert asyncio.run(resolve_concurrently()) == ["142.251.98.139"] * 10
+    assert calls == 1
+
+
+def test_resolver_prefers_ipv4_and_canonicalizes_ipv6():
+    resolver = make_resolver(ipv6=True)
+    infos = [
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("0:0:0:0:0:0:0:1", 0, 0, 0)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0)),
+    ]
+
+    async def query():
+        loop = asyncio.get_running_loop()
+        with patch("utils.resolver.aiodns", None), patch.object(
+            loop, "getaddrinfo", AsyncMock(return_value=infos)
+        ):
+            return await resolver._query("localhost")
+
+    assert asyncio.run(query()) == (["127.0.0.1", "::1"], 60)
@@ -0,0 +1,120 @@
+import itertools
+import multiprocessing
+from datetime import datetime
+from unittest.mock import patch
+import pytest
+from utils import GeoDocument, GeoLocationCache, SharedGeoCache
+
+ETAG = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture
+def open_cache(tmp_path):
+    caches = []
+
+    def open_cache(slots=64, slot_size=256, ttl=60):
+        cache = SharedGeoCache(str(tmp_path / "geo.cache"), slots, slot_size, ttl)
+        caches.append(cache)
+        return cache
+
+    yield open_cache
+    for cache in caches:
+        cache.close()
+
+
+def test_shared_cache_entries_are_visible_to_other_workers(open_cache):
+    writer, reader = open_cache(), open_cache()
+    modified_at = datetime(2024, 5, 1, 12, 30)
+
+    writer.put("1.1.1.1", b'{"ip":"1.1.1.1"}', ETAG, modified_at)
+    writer.put("2001:db8::1", b'{"ip":"2001:db8::1"}', ETAG, None)
+
+    assert reader.get("1.1.1.1") == (b'{"ip":"1.1.1.1"}', ETAG, modified_at)
+    assert reader.get("2001:db8::1") == (b'{"ip":"2001:db8::1"}', ETAG, None)
+    reader.invalidate("1.1.1.1")
+    assert writer.get("1.1.1.1") is None
+
+
+def _put_from_other_process(path):
+    cache = SharedGeoCache(path, 64, 256, 60)
+    cache.put("8.8.8.8", b'{"ip":"8.8.8.8"}', ETAG, None)
+    cache.close()
+
+
+def test_shared_cache_is_shared_between_processes(open_cache):
+    cache = open_cache()
+    process = multiprocessing.get_context("fork").Process(
+        target=_put_from_other_process, args=(cache.path,)
+    )
+    process.start()
+    process.join()
+
+    assert cache.get("8.8.8.8") == (b'{"ip":"8.8.8.8"}', ETAG, None)
+
+
+def test_shared_cache_replaces_oldest_entry_of_full_bucket(open_cache):
+    cache = open_cache(slots=4)
+    with patch("utils.shared_cache.time.time", side_effect=itertools.count(100)):
+        for n in range(5):
+            cache.put(f"10.0.0.{n}", b"{}", ETAG, None)
+
+        assert cache.get("10.0.0.0") is None
+        assert all(cache.get(f"10.0.0.{n}") for n in range(1, 5))
+
+
+def test_shared_cache_skips_oversized_and_expired_documents(open_cache):
+    cache = open_cache(slot_size=128, ttl=60)
+    cache.put("1.1.1.1", b"x" * 100, ETAG, None)
+    assert cache.get("1.1.1.1") is None
+
+    with patch("utils.shared_cache.time.time", return_value=1000.0):
+        cache.put("1.1.1.1", b"{}", ETAG, None)
+    with patch("utils.shared_cache.time.time", return_value=1061.0):
+        assert cache.get("1.1.1.1") is None
+
+
+def test_cache_with_shared_one_keeps_no_local_copies(open_cache):
+    worker = GeoLocationCache(
+        max_entries=10, max_bytes=1024, ttl=60, shared=open_cache()
+    )
+    other_worker = GeoLocationCache(
+        max_entries=10, max_bytes=1024, ttl=60, shared=open_cache()
+    )
+    document = GeoDocument(b'{"ip":"1.1.1.1"}', ETAG, None)
+
+    worker.put("1.1.1.1", document)
+    assert other_worker.get("1.1.1.1") == document
+    other_worker.invalidate("1.1.1.1")
+
+    # delete made by one worker is seen by the other one right away
+    assert worker.get("1.1.1.1") is None
+    assert worker.stats()["entries"] == other_worker.stats()["entries"] == 0
+    assert (other_worker.stats()["hits"], worker.stats()["misses"]) == (1, 1)
+
+
+def test_shared_cache_of_other_geometry_is_replaced_not_truncated(open_cache):
+    old = open_cache(slots=64)
+    old.put("1.1.1.1", b'{"ip":"1.1.1.1"}', ETAG, None)
+
+    new, other_new = open_cache(slots=128), open_cache(slots=128)
+    new.put("2.2.2.2", b'{"ip":"2.2.2.2"}', ETAG, None)
+
+    # old mapping stays readable (no SIGBUS) until its worker is restarted
+    assert old.get("1.1.1.1") == (b'{"ip":"1.1.1.1"}', ETAG, None)
+    assert new.get("1.1.1.1") is None
+    assert other_new.get("2.2.2.2") == (b'{"ip":"2.2.2.2"}', ETAG, None)
+
+
+def test_cache_invalidates_many_shared_entries(open_cache):
+    shared = open_cache()
+    cache = GeoLocationCache(max_entries=10, max_bytes=4096, ttl=60, shared=shared)
+    ips = [f"10.0.0.{n}" for n in range(5)]
+    for ip in ips:
+        cache.put(ip, GeoDocument(b"{}", ETAG, None))
+
+    cache.invalidate_many(ips[:2])
+    # more ips than cached entries
+    cache.invalidate_many([*ips[4:], *(f"11.0.0.{n}" for n in range(50))])
+
+    assert [ip for ip in ips if shared.get(ip)] == ips[2:4]
+    assert [ip for ip in ips if cache.get(ip)] == ips[2:4]
@@ -0,0 +1,123 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+from manage import main
+from tests.conftest import load
+from utils import Snapshot, SnapshotStore, snapshot_store
+from utils.locator import locator
+
+
+def build(database_url, path):
+    main(["--database-url", database_url, "build-snapshot", str(path)])
+    return str(path)
+
+
+def test_snapshot_finds_stored_ipv4_and_ipv6_locations(database_url, tmp_path):
+    ips = ["10.0.0.2", "1.1.1.1", "10.0.0.1", "2001:db8::1", "::1", "255.0.0.1"]
+    load(database_url, tmp_path, *[{"ip": ip, "city": ip} for ip in ips])
+
+    snapshot = Snapshot(build(database_url, tmp_path / "geo.snapshot"))
+
+    assert len(snapshot) == len(ips)
+    for ip in ips:
+        document = snapshot.get(ip)
+        assert json.loads(bytes(document.payload)) == {"ip": ip, "city": ip}
+        assert len(document.etag) == 32
+        assert document.modified_at is not None
+    assert snapshot.get("::ffff:1.1.1.1").payload == snapshot.get("1.1.1.1").payload
+    assert snapshot.get("10.0.0.3") is None
+    assert snapshot.get("2001:db8::2") is None
+
+
+def test_empty_snapshot_finds_nothing(database_url, tmp_path):
+    snapshot = Snapshot(build(database_url, tmp_path / "geo.snapshot"))
+
+    assert len(snapshot) == 0
+    assert snapshot.get("1.1.1.1") is None
+
+
+def test_store_swaps_replaced_snapshot(database_url, tmp_path):
+    path = tmp_path / "geo.snapshot"
+    store = SnapshotStore(str(path))
+    assert not store.reload()
+    assert store.get("1.1.1.1") is None
+
+    load(database_url, tmp_path, {"ip": "1.1.1.1", "city": "A"})
+    build(database_url, path)
+    assert store.reload()
+    old = store.get("1.1.1.1")
+    assert not store.reload()
+
+    load(database_url, tmp_path, {"ip": "2.2.2.2", "city": "B"})
+    build(database_url, path)
+    assert store.reload()
+
+    assert store.get("2.2.2.2") is not None
+    # payload taken before the swap is still readable
+    assert json.loads(bytes(old.payload)) == {"ip": "1.1.1.1", "city": "A"}
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_store_keeps_snapshot_when_file_is_invalid(database_url, tmp_path):
+    path = tmp_path / "geo.snapshot"
+    load(database_url, tmp_path, {"ip": "1.1.1.1", "city": "A"})
+    store = SnapshotStore(build(database_url, path))
+    store.reload()
+
+    invalid = tmp_path / "invalid"
+    invalid.write_bytes(b"garbage" * 20)
+    os.replace(invalid, path)
+
+    assert not store.reload()
+    assert store.get("1.1.1.1") is not None
+
+
+@pytest.mark.parametrize("mode", ["first", "only"])
+def test_get_geo_is_served_from_snapshot(
+    client, test_data, database_url, tmp_path, mode
+):
+    load(database_url, tmp_path, {"ip": "1.1.1.1", "city": "Snapshot"})
+    store = SnapshotStore(build(database_url, tmp_path / "geo.snapshot"))
+    store.reload()
+
+    with patch("app.settings.snapshot_mode", mode), patch.object(
+        snapshot_store, "current", store.current
+    ):
+        response = client.get("/geo", params={"ip": "1.1.1.1"})
+        stored = client.get("/geo", params={"ip": test_data[1].ip})
+        revalidated = client.get(
+            "/geo",
+            params={"ip": "1.1.1.1"},
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+
+    assert response.status_code == 200
+    assert response.json() == {"ip": "1.1.1.1", "city": "Snapshot"}
+    assert revalidated.status_code == 304
+    # database is not read in "only" mode
+    assert stored.status_code == (200 if mode == "first" else 404)
+
+
+@pytest.mark.usefixtures("mock_locator")
+@pytest.mark.parametrize("mode", ["first", "only"])
+def test_post_geo_checks_database_not_snapshot(
+    client, test_data, database_url, tmp_path, mode
+):
+    stored = test_data[1].ip
+    load(database_url, tmp_path, {"ip": "162.159.140.229", "city": "Snapshot"})
+    store = SnapshotStore(build(database_url, tmp_path / "geo.snapshot"))
+    store.reload()
+
+    with patch("app.settings.snapshot_mode", mode), patch.object(
+        snapshot_store, "current", store.current
+    ), patch.object(
+        locator, "get_location_for", side_effect=locator.get_location_for
+    ) as get_location_for:
+        existing = client.post("/geo", json={"ip": stored})
+        # only in the snapshot, not stored (anymore)
+        created = client.post("/geo", json={"ip": "162.159.140.229"})
+
+    assert existing.status_code == 409
+    assert get_location_for.await_count == 1
+    assert created.status_code == 201
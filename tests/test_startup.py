@@ -0,0 +1,76 @@
+import asyncio
+from unittest.mock import patch
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app import app
+from database import Base, create_engine
+from models import GeoLocation
+from utils import geo_cache, get_db, get_read_db
+from utils.startup import startup
+
+
+@pytest.fixture
+def database(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'startup.db'}")
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with session_maker() as db:
+            db.add_all(
+                [
+                    GeoLocation(ip=ip, ipstack_response={"ip": ip})
+                    for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3")
+                ]
+            )
+            await db.commit()
+
+    async def override_get_db():
+        async with session_maker() as db:
+            yield db
+
+    asyncio.run(setup())
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    with patch("app.engine", engine), patch("app.read_engine", engine), patch(
+        "app.SessionMaker", session_maker
+    ):
+        yield
+    app.dependency_overrides.clear()
+    geo_cache.clear()
+
+
+def test_startup_preloads_hot_ips_and_saves_them_on_shutdown(database, tmp_path):
+    path = tmp_path / "hot.txt"
+    path.write_text("2.2.2.2\nnot an ip\n9.9.9.9\n1.1.1.1\n")
+    geo_cache.clear()
+
+    with patch("app.settings.cache_warm_path", str(path)):
+        with TestClient(app) as client:
+            # hottest ip first
+            assert geo_cache.recent_ips(10) == ["2.2.2.2", "1.1.1.1"]
+            ready = client.get("/ready")
+            metrics = client.get("/metrics").text
+            client.get("/geo", params={"ip": "3.3.3.3"})
+
+    assert ready.status_code == 200
+    assert ready.json()["startup_seconds"] > 0
+    assert set(ready.json()["phases"]) == {
+        "database",
+        "dictionaries",
+        "networks",
+        "cache",
+    }
+    assert "app_startup_seconds " in metrics
+    assert path.read_text() == "3.3.3.3\n2.2.2.2\n1.1.1.1\n"
+
+
+def test_ready_returns_503_until_startup_is_done(client):
+    with patch.object(startup, "seconds", None):
+        response = client.get("/ready")
+
+    assert response.status_code == 503
+    assert response.json() == {"message": "Application is starting"}
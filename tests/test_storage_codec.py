@@ -0,0 +1,171 @@
+import json
+import pytest
+from unittest.mock import patch
+from sqlalchemy import select
+from manage import main, sync_engine
+from models import GeoLocation
+from storage_codec import (
+    StorageCodec,
+    storage_codec,
+    train_dictionary,
+    zstd_available,
+)
+from tests.conftest import load
+
+CODECS = [
+    "zlib",
+    pytest.param(
+        "zstd",
+        marks=pytest.mark.skipif(
+            not zstd_available(), reason="zstandard not installed"
+        ),
+    ),
+]
+DOCUMENT = {
+    "ip": "134.201.250.155",
+    "type": "ipv4",
+    "continent_code": "NA",
+    "continent_name": "North America",
+    "country_code": "US",
+    "country_name": "United States",
+    "region_code": "CA",
+    "region_name": "California",
+    "city": "Los Angeles",
+    "zip": "90013",
+    "latitude": 34.0453,
+    "longitude": -118.2413,
+    "location": {
+        "capital": "Washington D.C.",
+        "languages": [{"code": "en", "name": "English", "native": "English"}],
+        "country_flag_emoji": "🇺🇸",
+        "calling_code": "1",
+        "is_eu": False,
+    },
+}
+
+
+@pytest.fixture
+def codec():
+    # documents are written as text unless a test says otherwise and
+    # dictionaries registered by a test do not leak into others
+    with patch.object(storage_codec, "codec", "none"), patch.object(
+        storage_codec, "dictionary", 0
+    ), patch.object(
+        storage_codec, "_dictionaries", dict(storage_codec._dictionaries)
+    ), patch.object(
+        storage_codec, "_zstd", {}
+    ):
+        yield storage_codec
+
+
+def documents(count):
+    return [
+        {**DOCUMENT, "ip": f"10.0.{n // 256}.{n % 256}", "city": f"City {n}"}
+        for n in range(count)
+    ]
+
+
+def stored_documents(database_url):
+    engine = sync_engine(database_url)
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(GeoLocation.ip, GeoLocation.etag, GeoLocation.version)
+        ).all()
+        raw = connection.exec_driver_sql(
+            "SELECT ipstack_response FROM geo_location"
+        ).scalars()
+        stored = list(raw)
+    engine.dispose()
+    return rows, stored
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_documents_round_trip_compressed(name):
+    codec = StorageCodec(name, 0)
+    text = json.dumps(DOCUMENT, ensure_ascii=False)
+
+    encoded = codec.encode(text)
+
+    assert isinstance(encoded, bytes)
+    assert len(encoded) < len(text.encode())
+    assert codec.decode(encoded) == text.encode()
+
+
+def test_text_is_kept_when_not_smaller_and_read_by_any_codec():
+    codec = StorageCodec("zlib", 0)
+
+    assert codec.encode("{}") == "{}"
+    assert StorageCodec("none", 0).decode('{"ip":"1.1.1.1"}') == b'{"ip":"1.1.1.1"}'
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_trained_dictionary_is_needed_to_decode(name):
+    samples = [json.dumps(document).encode() for document in documents(200)]
+    dictionary = train_dictionary(name, samples, 4096)
+    writer = StorageCodec(name, 1)
+    writer.register(1, name, dictionary)
+    encoded = writer.encode(json.dumps({**DOCUMENT, "city": "Trained"}))
+
+    reader = StorageCodec("none", 0)
+    with pytest.raises(LookupError):
+        reader.decode(encoded)
+    reader.register(1, name, dictionary)
+
+    assert json.loads(reader.decode(encoded))["city"] == "Trained"
+
+
+def test_check_fails_for_dictionary_that_is_not_loaded():
+    with pytest.raises(LookupError):
+        StorageCodec("zlib", 7).check()
+
+
+@pytest.mark.usefixtures("mock_locator")
+def test_compressed_documents_are_served(client, codec):
+    with patch.object(codec, "codec", "zlib"):
+        created = client.post("/geo", json={"ip": "162.159.140.229"})
+        fetched = client.get("/geo", params={"ip": "162.159.140.229"})
+    # stored rows are read back whatever the codec is now
+    text = client.get("/geo", params={"ip": "162.159.140.229"})
+
+    assert created.status_code == 201
+    assert fetched.status_code == 200
+    assert fetched.json() == created.json() == text.json()
+
+
+def test_recompress_keeps_documents_etags_and_versions(database_url, tmp_path, codec):
+    load(database_url, tmp_path, *documents(50))
+    before, stored = stored_documents(database_url)
+    assert all(isinstance(value, str) for value in stored)
+
+    with patch.object(codec, "codec", "zlib"):
+        main(["--database-url", database_url, "recompress", "--chunk-size", "20"])
+    after, compressed = stored_documents(database_url)
+
+    assert after == before
+    assert all(isinstance(value, bytes) for value in compressed)
+    assert [json.loads(codec.decode(value)) for value in compressed] == [
+        json.loads(value) for value in stored
+    ]
+
+
+def test_recompress_with_trained_dictionary(database_url, tmp_path, codec):
+    load(database_url, tmp_path, *documents(200))
+    with patch.object(codec, "codec", "zlib"):
+        main(["--database-url", database_url, "recompress"])
+    _, builtin = stored_documents(database_url)
+
+    main(["--database-url", database_url, "train-dictionary", "--size", "4096"])
+    with patch.object(codec, "codec", "zlib"), patch.object(codec, "dictionary", 1):
+        main(["--database-url", database_url, "recompress"])
+    _, trained = stored_documents(database_url)
+
+    assert sum(map(len, trained)) < sum(map(len, builtin))
+    assert [codec.decode(value) for value in trained] == [
+        codec.decode(value) for value in builtin
+    ]
+
+
+def test_recompress_fails_for_unknown_dictionary(database_url, codec):
+    with patch.object(codec, "codec", "zlib"), patch.object(codec, "dictionary", 3):
+        with pytest.raises(LookupError):
+            main(["--database-url", database_url, "recompress"])
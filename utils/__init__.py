@@ -1,3 +1,46 @@
-from utils.dependencies import get_db, get_locator
-from utils.locator import Locator, IPAddress
+# singletons named like their modules (locator, resolver, ...) are imported
+# from the modules, re-exported here they would hide them
+from utils.dependencies import get_db, get_read_db, get_locator
+from utils.locator import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    IPAddress,
+    Locator,
+    UpstreamUnavailable,
+)
+from utils.ipstack_client import (
+    IpstackClient,
+    IpstackError,
+    IpstackUnavailable,
+)
 from utils.logger import setup_logger
+from utils.cache import (
+    GeoDocument,
+    GeoLocationCache,
+    geo_cache,
+    load_hot_ips,
+    save_hot_ips,
+)
+from utils.shared_cache import SharedGeoCache
+from utils.fields import IPSTACK_FIELDS, FieldSelection
+from utils.snapshot import Snapshot, SnapshotStore, build_snapshot, snapshot_store
+from utils.resolver import Resolver
+from utils.singleflight import SingleFlight
+from utils.group_commit import GroupCommitWriter
+from utils.rate_limit import (
+    RateLimitMiddleware,
+    TokenBucketLimiter,
+    read_limiter,
+    write_limiter,
+)
+from utils.refresher import Refresher
+from utils.prefix_index import PrefixIndex, network_index
+from utils.metrics import (
+    Gauge,
+    Histogram,
+    MetricsMiddleware,
+    TimedJSONResponse,
+    registry,
+    timed,
+)
+from utils.startup import Startup
@@ -0,0 +1,179 @@
+import itertools
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Collection, NamedTuple
+
+from database import pack_ip
+from settings import settings
+from utils.shared_cache import SharedGeoCache
+
+
+class GeoDocument(NamedTuple):
+    """Serialized ipstack response with its validators."""
+
+    payload: bytes
+    etag: str
+    modified_at: datetime | None
+
+
+class GeoLocationCache:
+    """In-process read-through cache of serialized ipstack responses keyed by ip.
+
+    Entries expire after ``ttl`` seconds; least recently used entries are
+    evicted once ``max_entries`` or ``max_bytes`` (total payload size) would be
+    exceeded. Setting ``max_entries`` to 0 disables the cache.
+    With ``shared`` cache the local entries are not used: documents are kept
+    once for all worker processes and deletes are seen by all of them at once.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+        shared: SharedGeoCache | None = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        # ip -> (expires_at, size, document), oldest first
+        self._entries: OrderedDict[str, tuple[float, int, GeoDocument]] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.shared is not None or self.max_entries > 0
+
+    def get(self, ip: str) -> GeoDocument | None:
+        if self.shared is not None:
+            return self._get_shared(ip)
+        entry = self._entries.get(ip)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._remove(ip)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(ip)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        return None
+
+    def put(self, ip: str, document: GeoDocument):
+        if self.shared is not None:
+            self.shared.put(ip, *document)
+        else:
+            self._put_local(ip, document)
+
+    def invalidate(self, ip: str):
+        if self.shared is not None:
+            self.shared.invalidate(ip)
+        self._remove(ip)
+
+    def invalidate_many(self, ips: Collection[str]):
+        if self.shared is not None:
+            self.shared.invalidate_many(ips)
+        if len(ips) > len(self._entries):
+            # large deletes are matched against cached entries instead
+            wanted = set(ips)
+            ips = [ip for ip in self._entries if ip in wanted]
+        for ip in ips:
+            self._remove(ip)
+
+    def clear(self):
+        if self.shared is not None:
+            self.shared.clear()
+        self._entries.clear()
+        self._size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        stats = {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+    def recent_ips(self, limit: int) -> list[str]:
+        """Return up to limit most recently used ips, most recent first."""
+        return list(itertools.islice(reversed(self._entries), limit))
+
+    def _get_shared(self, ip: str) -> GeoDocument | None:
+        entry = self.shared.get(ip)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return GeoDocument(*entry)
+
+    def _put_local(self, ip: str, document: GeoDocument):
+        if not self.enabled:
+            return
+        self._remove(ip)
+        size = len(document.payload)
+        if size > self.max_bytes:
+            return
+        self._entries[ip] = (time.monotonic() + self.ttl, size, document)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def _remove(self, ip: str):
+        entry = self._entries.pop(ip, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+
+def save_hot_ips(path: str, ips: list[str]):
+    # every worker writes its own file and renames it, the last one wins
+    temporary = f"{path}.{os.getpid()}"
+    with open(temporary, "w") as file:
+        file.writelines(f"{ip}\n" for ip in ips)
+    os.replace(temporary, path)
+
+
+def load_hot_ips(path: str, limit: int) -> list[str]:
+    """Return up to limit ips saved by save_hot_ips, skipping invalid lines."""
+    try:
+        with open(path) as file:
+            lines = [line.strip() for line in itertools.islice(file, limit)]
+    except FileNotFoundError:
+        return []
+    ips = []
+    for line in lines:
+        try:
+            pack_ip(line)
+        except ValueError:
+            continue
+        ips.append(line)
+    return ips
+
+
+geo_cache = GeoLocationCache(
+    max_entries=settings.cache_max_entries,
+    max_bytes=settings.cache_max_bytes,
+    ttl=settings.cache_ttl,
+    shared=(
+        SharedGeoCache(
+            settings.shared_cache_path,
+            slots=settings.shared_cache_slots,
+            slot_size=settings.shared_cache_slot_size,
+            ttl=settings.cache_ttl,
+        )
+        if settings.shared_cache_path
+        else None
+    ),
+)
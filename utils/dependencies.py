@@ -1,5 +1,5 @@
-from utils.locator import Locator
-from database import SessionMaker
+from utils.locator import Locator, locator
+from database import SessionMaker, ReadSessionMaker
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -8,5 +8,10 @@ async def get_db() -> AsyncSession:
         yield db
 
 
-def get_locator():
-    return Locator()
+async def get_read_db() -> AsyncSession:
+    async with ReadSessionMaker() as db:
+        yield db
+
+
+def get_locator() -> Locator:
+    return locator
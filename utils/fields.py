@@ -0,0 +1,127 @@
+from sqlalchemy import ColumnElement, String, func, literal
+
+# fields of ipstack responses, objects with their own fields
+IPSTACK_FIELDS: dict[str, tuple[str, ...]] = {
+    "ip": (),
+    "hostname": (),
+    "type": (),
+    "continent_code": (),
+    "continent_name": (),
+    "country_code": (),
+    "country_name": (),
+    "region_code": (),
+    "region_name": (),
+    "city": (),
+    "zip": (),
+    "latitude": (),
+    "longitude": (),
+    "msa": (),
+    "dma": (),
+    "radius": (),
+    "ip_routing_type": (),
+    "connection_type": (),
+    "location": (
+        "geoname_id",
+        "capital",
+        "languages",
+        "country_flag",
+        "country_flag_emoji",
+        "country_flag_emoji_unicode",
+        "calling_code",
+        "is_eu",
+    ),
+    "time_zone": ("id", "current_time", "gmt_offset", "code", "is_daylight_saving"),
+    "currency": ("code", "name", "plural", "symbol", "symbol_native"),
+    "connection": (
+        "asn",
+        "isp",
+        "sld",
+        "tld",
+        "carrier",
+        "home",
+        "organization_type",
+        "isic_code",
+        "naics_code",
+    ),
+    "security": (
+        "is_proxy",
+        "proxy_type",
+        "is_crawler",
+        "crawler_name",
+        "crawler_type",
+        "is_tor",
+        "threat_level",
+        "threat_types",
+        "proxy_last_detected",
+        "proxy_level",
+        "vpn_service",
+        "anonymizer_status",
+        "hosting_facility",
+    ),
+}
+
+
+class FieldSelection:
+    """Subset of ipstack response fields, like `country_code,location.capital`.
+
+    Selected fields keep their nesting and are null when the document does
+    not have them, whether they are picked in Python or in sqlite.
+    """
+
+    def __init__(self, value: str):
+        # field -> None for the whole value, or selected fields of an object
+        self.tree: dict[str, dict[str, None] | None] = {}
+        unknown = []
+        for path in filter(None, (path.strip() for path in value.split(","))):
+            name, _, field = path.partition(".")
+            known = IPSTACK_FIELDS.get(name)
+            if known is None or field and field not in known:
+                unknown.append(path)
+            elif not field:
+                self.tree[name] = None
+            elif self.tree.get(name, {}) is not None:
+                self.tree.setdefault(name, {})[field] = None
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if not self.tree:
+            raise ValueError("At least one field has to be selected")
+
+    @property
+    def key(self) -> str:
+        """Normalized selection, same for every spelling of it."""
+        return ",".join(
+            name if fields is None else ",".join(f"{name}.{f}" for f in fields)
+            for name, fields in self.tree.items()
+        )
+
+    def project(self, document: dict) -> dict:
+        projected = {}
+        for name, fields in self.tree.items():
+            value = document.get(name)
+            if fields is not None:
+                value = value if isinstance(value, dict) else {}
+                value = {field: value.get(field) for field in fields}
+            projected[name] = value
+        return projected
+
+    def sql(self, column: ColumnElement) -> ColumnElement:
+        """sqlite expression building projected document from JSON text column."""
+
+        def extract(path: str) -> ColumnElement:
+            # -> keeps JSON values (true, objects) as JSON inside json_object
+            return column.op("->")(literal(path, String))
+
+        arguments = []
+        for name, fields in self.tree.items():
+            if fields is None:
+                value = extract(f"$.{name}")
+            else:
+                value = func.json_object(
+                    *(
+                        part
+                        for field in fields
+                        for part in (field, extract(f"$.{name}.{field}"))
+                    )
+                )
+            arguments += [name, value]
+        return func.json_object(*arguments)
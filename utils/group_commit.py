@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionMaker
+from models import GeoLocation
+from settings import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+
+class GroupCommitWriter:
+    """Inserts geo locations of concurrent requests in shared transactions.
+
+    Rows wait up to max_delay seconds (or until max_batch of them are queued)
+    and are written with one statement and one commit. Rows queued while a
+    batch is written go with the next one, so there is one writer at a time.
+    Every caller gets its own outcome: created, already stored, or the error.
+    Batch failing on its rows is retried row by row, while failure of the
+    whole transaction (like locked database) fails all of its rows at once.
+    """
+
+    def __init__(self, session_maker: sessionmaker, max_delay: float, max_batch: int):
+        self.session_maker = session_maker
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._pending: list[tuple[dict, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._writer: asyncio.Task | None = None
+
+    async def insert(self, row: dict) -> bool:
+        """Insert geo_location row, return False when its ip is already stored."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if self._writer is None:
+            if len(self._pending) >= self.max_batch:
+                self._start()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_delay, self._start)
+        return await future
+
+    def _start(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write_pending())
+
+    async def _write_pending(self):
+        try:
+            while self._pending:
+                batch = self._pending[: self.max_batch]
+                del self._pending[: self.max_batch]
+                await self._write(batch)
+        finally:
+            self._writer = None
+
+    async def _write(self, batch: list[tuple[dict, asyncio.Future]]):
+        try:
+            created = await self._insert([row for row, _ in batch])
+        except OperationalError as exc:
+            # retrying rows one by one would only wait for the lock again
+            self._fail(batch, exc)
+            return
+        except Exception as exc:
+            if len(batch) == 1:
+                self._fail(batch, exc)
+                return
+            # row failing the batch fails only its own request
+            logger.warning(
+                "Group commit of %d rows failed, retrying one by one", len(batch)
+            )
+            for item in batch:
+                await self._write([item])
+            return
+        for row, future in batch:
+            # ip queued twice in one batch is created by the first row
+            if not future.done():
+                future.set_result(row["ip"] in created)
+            created.discard(row["ip"])
+
+    @staticmethod
+    def _fail(batch: list[tuple[dict, asyncio.Future]], exc: Exception):
+        for _, future in batch:
+            # caller may have been cancelled in the meantime
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _insert(self, rows: list[dict]) -> set[str]:
+        query = (
+            insert(GeoLocation)
+            .on_conflict_do_nothing(index_elements=[GeoLocation.ip])
+            .returning(GeoLocation.ip)
+        )
+        async with self.session_maker() as db:
+            created = set((await db.execute(query, rows)).scalars())
+            await db.commit()
+        return created
+
+
+group_commit = GroupCommitWriter(
+    SessionMaker, settings.group_commit_delay, settings.group_commit_max_batch
+)
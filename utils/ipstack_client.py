@@ -0,0 +1,124 @@
+import asyncio
+from typing import TYPE_CHECKING
+from settings import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class IpstackError(Exception):
+    pass
+
+
+class IpstackUnavailable(IpstackError):
+    """Ipstack answered with retryable status (429, 5xx) to the last attempt."""
+
+    def __init__(self, status_code: int, retry_after: float | None):
+        super().__init__(f"Ipstack answered with status {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class IpstackClient:
+    """Async ipstack API client shared for the whole application lifetime.
+
+    Keeps connections alive in a pool, limits number of requests in flight and
+    retries transport errors and retryable statuses with exponential backoff.
+    Responses are processed like in ``ipstack.GeoLookup``: None for non 200
+    status and IpstackError for error reported in the body, except retryable
+    statuses left after the last attempt, raised as IpstackUnavailable.
+    """
+
+    def __init__(
+        self,
+        access_key: str,
+        base_url: str,
+        connect_timeout: float,
+        read_timeout: float,
+        max_in_flight: int,
+        retries: int,
+        retry_backoff: float,
+    ):
+        self.access_key = access_key
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._client = None
+        self._client_loop = None
+
+    async def get_location(self, *ips: str) -> dict | list[dict] | None:
+        """Return location of single ip, or list of locations for many (bulk)."""
+        # imported on first call, keeps it out of application startup
+        import httpx
+
+        path = "/" + ",".join(ips)
+        params = {"access_key": self.access_key, "output": "json"}
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await self._get_client().get(path, params=params)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    break
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_backoff * 2**attempt)
+
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise IpstackUnavailable(
+                response.status_code, _retry_after(response.headers)
+            )
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        if isinstance(data, dict) and "error" in data:
+            raise IpstackError("IPStack Error: " + data["error"].get("info", ""))
+        return data
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        import httpx
+
+        # pooled connections are bound to the loop they were opened in
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_in_flight,
+                    max_keepalive_connections=self.max_in_flight,
+                ),
+            )
+            self._client_loop = loop
+        return self._client
+
+
+def _retry_after(headers) -> float | None:
+    # only delay in seconds, http dates are not worth parsing here
+    try:
+        return max(0.0, float(headers.get("Retry-After", "")))
+    except ValueError:
+        return None
+
+
+ipstack_client = IpstackClient(
+    access_key=settings.ipstack_key,
+    base_url=settings.ipstack_url,
+    connect_timeout=settings.ipstack_connect_timeout,
+    read_timeout=settings.ipstack_read_timeout,
+    max_in_flight=settings.ipstack_max_in_flight,
+    retries=settings.ipstack_retries,
+    retry_backoff=settings.ipstack_retry_backoff,
+)
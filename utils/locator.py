@@ -1,28 +1,268 @@
-from ipstack import GeoLookup
+import asyncio
+import logging
+import time
+from collections import deque
 from settings import settings
+from database import canonical_ip
 from ipaddress import IPv4Address, IPv6Address
-import socket
 from typing import Union
-from fastapi.concurrency import run_in_threadpool
+from utils.ipstack_client import IpstackClient, IpstackUnavailable, ipstack_client
+from utils.metrics import Gauge, registry, timed
+from utils.resolver import resolver
 
 IPAddress = Union[IPv4Address, IPv6Address]
+logger = logging.getLogger(settings.logger_name)
+
+
+class UpstreamUnavailable(Exception):
+    """Ipstack is not called, because it is failing or overloaded."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calls to upstream failing too often, until it is probed healthy.
+
+    Outcomes of the last `window` calls are kept, calls slower than slow_call
+    count as failed. When failure ratio reaches failure_ratio the circuit opens
+    and calls are rejected for open_for seconds. Then up to `probes` calls are
+    let through (half-open), closing the circuit if they all succeed and
+    opening it again on first failure.
+    """
+
+    def __init__(
+        self,
+        failure_ratio: float,
+        window: int,
+        slow_call: float,
+        open_for: float,
+        probes: int,
+    ):
+        self.failure_ratio = failure_ratio
+        self.window = window
+        self.slow_call = slow_call
+        self.open_for = open_for
+        self.probes = probes
+        self.reset()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.open_for:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Raise UpstreamUnavailable when call must not be made."""
+        state = self.state
+        if state == "open":
+            retry_after = self._opened_at + self.open_for - time.monotonic()
+            raise UpstreamUnavailable("Ipstack circuit is open", retry_after)
+        if state == "half_open":
+            if self._probes_left <= 0:
+                raise UpstreamUnavailable("Ipstack circuit is half open", 1.0)
+            self._probes_left -= 1
+
+    def record(self, failed: bool, elapsed: float):
+        failed = failed or elapsed > self.slow_call
+        if self._opened_at is not None:
+            if failed:
+                self._open()
+            elif self.state == "half_open":
+                self._probes_passed += 1
+                if self._probes_passed >= self.probes:
+                    self.reset()
+            return
+
+        self._outcomes.append(failed)
+        self._failures += failed
+        if len(self._outcomes) > self.window:
+            self._failures -= self._outcomes.popleft()
+        if (
+            len(self._outcomes) == self.window
+            and self._failures >= self.failure_ratio * self.window
+        ):
+            self._open()
+
+    def reset(self):
+        self._outcomes: deque[bool] = deque()
+        self._failures = 0
+        self._opened_at = None
+        self._probes_left = 0
+        self._probes_passed = 0
+
+    def _open(self):
+        logger.warning("Ipstack circuit opened")
+        self._outcomes.clear()
+        self._failures = 0
+        self._opened_at = time.monotonic()
+        self._probes_left = self.probes
+        self._probes_passed = 0
+
+
+class AdaptiveLimiter:
+    """Concurrency cap adjusted with additive increase, multiplicative decrease.
+
+    Limit grows by one per `limit` successful calls answered within
+    latency_target and is multiplied by backoff on failed or slow ones,
+    staying between min_limit and max_limit.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        backoff: float,
+    ):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._released = asyncio.Event()
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            self._released.clear()
+            await self._released.wait()
+        self.in_flight += 1
+
+    def release(self, failed: bool, elapsed: float):
+        self.in_flight -= 1
+        if failed or elapsed > self.latency_target:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._released.set()
+
+    def reset(self):
+        self.limit = float(self.initial)
+        self.in_flight = 0
+        # event is bound to the loop it is first awaited in
+        self._released = asyncio.Event()
 
 
 class Locator:
-    def __init__(self):
-        self.ipstack_lookup = GeoLookup(settings.ipstack_key)
+    """Finds ips of urls and their locations in ipstack.
+
+    Ipstack calls go through circuit breaker and adaptive concurrency limiter
+    and have a deadline, so unhealthy upstream fails them fast with
+    UpstreamUnavailable instead of piling them up.
+    """
+
+    def __init__(
+        self,
+        ipstack_client: IpstackClient,
+        breaker: CircuitBreaker,
+        limiter: AdaptiveLimiter,
+        deadline: float,
+    ):
+        self.ipstack_client = ipstack_client
+        self.breaker = breaker
+        self.limiter = limiter
+        self.deadline = deadline
 
     async def get_location_for(self, ip: str):
-        # probably not the bottleneck, but used for async demonstration
-        return await run_in_threadpool(self.ipstack_lookup.get_location, ip)
+        return await self._call_ipstack(ip)
+
+    async def _call_ipstack(self, *ips: str):
+        # imported on first call, like in the client raising its errors
+        import httpx
+
+        self.breaker.before_call()
+        start = time.monotonic()
+        failed = True
+        try:
+            # deadline covers waiting for a slot, retries and backoff
+            async with asyncio.timeout(self.deadline):
+                await self.limiter.acquire()
+                try:
+                    with timed("upstream"):
+                        result = await self.ipstack_client.get_location(*ips)
+                    failed = False
+                    return result
+                finally:
+                    self.limiter.release(failed, time.monotonic() - start)
+        except TimeoutError:
+            raise UpstreamUnavailable("Ipstack did not answer in time", 1.0)
+        except IpstackUnavailable as exc:
+            # failing or rate limiting upstream, counted as failed call above
+            raise UpstreamUnavailable(str(exc), exc.retry_after or 1.0) from exc
+        except httpx.TransportError as exc:
+            # connection errors left after the last retry
+            raise UpstreamUnavailable(str(exc), 1.0) from exc
+        finally:
+            self.breaker.record(failed, time.monotonic() - start)
+
+    async def get_locations_for(self, ips: list[str]) -> dict[str, dict | None]:
+        """Look up many ips, with at most ipstack_concurrency calls in flight.
+
+        None is reported only for ips ipstack has no data for, failed calls
+        raise like single lookups do.
+        """
+        semaphore = asyncio.Semaphore(settings.ipstack_concurrency)
+        size = settings.ipstack_bulk_size
+
+        async def lookup(chunk: list[str]) -> dict[str, dict | None]:
+            async with semaphore:
+                if len(chunk) == 1:
+                    return {chunk[0]: await self.get_location_for(chunk[0])}
+                found = await self._call_ipstack(*chunk)
+                return {location["ip"]: location for location in found or []}
+
+        chunks = [ips[i : i + size] for i in range(0, len(ips), size)]
+        locations = dict.fromkeys(ips)
+        for found in await asyncio.gather(*[lookup(chunk) for chunk in chunks]):
+            locations.update(found)
+        return locations
 
     @staticmethod
     async def resolve_to_ip(ip_or_url: IPAddress | str) -> str | None:
         match ip_or_url:
             case IPv4Address() | IPv6Address():
-                return str(ip_or_url)
+                return str(canonical_ip(ip_or_url))
             case str() as url:
-                try:
-                    return await run_in_threadpool(socket.gethostbyname, url)
-                except socket.gaierror:
-                    return None
+                with timed("dns"):
+                    return await resolver.resolve(url)
+
+
+# one instance for the whole application, sharing pooled ipstack client
+locator = Locator(
+    ipstack_client,
+    CircuitBreaker(
+        failure_ratio=settings.ipstack_breaker_failure_ratio,
+        window=settings.ipstack_breaker_window,
+        slow_call=settings.ipstack_slow_call,
+        open_for=settings.ipstack_breaker_open_for,
+        probes=settings.ipstack_breaker_probes,
+    ),
+    AdaptiveLimiter(
+        initial=settings.ipstack_concurrency,
+        min_limit=1,
+        max_limit=settings.ipstack_max_in_flight,
+        latency_target=settings.ipstack_slow_call,
+        backoff=0.5,
+    ),
+    deadline=settings.ipstack_deadline,
+)
+registry.register(
+    Gauge(
+        "ipstack_circuit_open",
+        "1 when ipstack calls are rejected by open or half-open circuit.",
+        lambda: int(locator.breaker.state != "closed"),
+    )
+)
+registry.register(
+    Gauge(
+        "ipstack_concurrency_limit",
+        "Current adaptive limit of ipstack calls in flight.",
+        lambda: int(locator.limiter.limit),
+    )
+)
@@ -5,6 +5,9 @@ from settings import settings
 def setup_logger():
     logger = logging.getLogger(settings.logger_name)
     logger.setLevel(logging.INFO)
+    # called again by every startup of the application (and tests)
+    if logger.handlers:
+        return
 
     handler = logging.StreamHandler()
     fmt = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
@@ -0,0 +1,262 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from anyio.to_thread import current_default_thread_limiter
+from fastapi.responses import JSONResponse
+
+from database import dumps_json, engine, read_engine
+from utils.cache import geo_cache
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# phase -> seconds spent in it by the current request
+_phase_timings: ContextVar[dict[str, float] | None] = ContextVar(
+    "phase_timings", default=None
+)
+
+
+class Histogram:
+    def __init__(
+        self, name: str, doc: str, labels: tuple[str, ...], buckets=LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket, sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, label_values: tuple[str, ...], value: float):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for label_values, (bucket_counts, total, count) in self._series.items():
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = _format_labels(("le",), (str(bound),))
+                lines.append(f"{self.name}_bucket{_join(labels, le)} {cumulative}")
+            le = _format_labels(("le",), ("+Inf",))
+            lines.append(f"{self.name}_bucket{_join(labels, le)} {count}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from callback when metrics are rendered.
+
+    ``kind`` can be set to "counter" for monotonic values kept elsewhere.
+    With ``labels`` the callback returns values by label values instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        read: Callable[[], float | dict[tuple[str, ...], float | None] | None],
+        kind: str = "gauge",
+        labels: tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.doc = doc
+        self.read = read
+        self.kind = kind
+        self.labels = labels
+
+    def render(self) -> list[str]:
+        value = self.read()
+        series = value if self.labels else {(): value}
+        series = {values: v for values, v in series.items() if v is not None}
+        if not series:
+            return []
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in series.items():
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list[Histogram | Gauge] = []
+
+    def register(self, metric: Histogram | Gauge) -> Histogram | Gauge:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+
+
+registry = MetricsRegistry()
+request_latency = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Request latency by route.",
+        ("method", "route", "status"),
+    )
+)
+phase_latency = registry.register(
+    Histogram(
+        "http_request_phase_duration_seconds",
+        "Time spent by request in dns, db, upstream and serialize phases.",
+        ("route", "phase"),
+    )
+)
+
+
+def _pool_stats(name: str) -> dict[tuple[str], int | None]:
+    # read pool exists only with DATABASE_READ_POOL, GETs use write one otherwise
+    pools = {("write",): engine.pool}
+    if read_engine is not engine:
+        pools[("read",)] = read_engine.pool
+    # only queue pools report their size and checked out connections
+    stats = {labels: getattr(pool, name, None) for labels, pool in pools.items()}
+    return {labels: stat() if stat else None for labels, stat in stats.items()}
+
+
+for _name, _doc, _read in [
+    (
+        "threadpool_busy_threads",
+        "Threadpool workers in use.",
+        lambda: current_default_thread_limiter().borrowed_tokens,
+    ),
+    (
+        "threadpool_size",
+        "Threadpool capacity.",
+        lambda: current_default_thread_limiter().total_tokens,
+    ),
+    (
+        "geo_cache_entries",
+        "Entries in geo location cache.",
+        lambda: geo_cache.stats()["entries"],
+    ),
+    (
+        "geo_cache_bytes",
+        "Approximate geo location cache size.",
+        lambda: geo_cache.stats()["bytes"],
+    ),
+]:
+    registry.register(Gauge(_name, _doc, _read))
+for _name, _doc, _stat in [
+    ("db_pool_checked_out", "Database connections in use.", "checkedout"),
+    ("db_pool_size", "Database connection pool size.", "size"),
+]:
+    registry.register(
+        Gauge(_name, _doc, lambda stat=_stat: _pool_stats(stat), labels=("pool",))
+    )
+for _name in ("hits", "misses", "evictions"):
+    registry.register(
+        Gauge(
+            f"geo_cache_{_name}_total",
+            f"Geo location cache {_name}.",
+            lambda name=_name: getattr(geo_cache, name),
+            kind="counter",
+        )
+    )
+
+
+@contextmanager
+def timed(phase: str):
+    """Add time spent in the block to the current request's phase timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _phase_timings.get()
+        if timings is not None:
+            elapsed = time.perf_counter() - start
+            timings[phase] = timings.get(phase, 0.0) + elapsed
+
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with timed("serialize"):
+            return dumps_json(content).encode()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request and phase latencies.
+
+    Phase timings are also returned to the client in Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = {}
+        token = _phase_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_server_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                entries = [f"{p};dur={t * 1000:.2f}" for p, t in timings.items()]
+                entries.append(f"total;dur={(time.perf_counter() - start) * 1000:.2f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(entries).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            _phase_timings.reset(token)
+            route = scope.get("route")
+            # unmatched paths share one label, to keep number of series bounded
+            path = getattr(route, "path", "unmatched")
+            elapsed = time.perf_counter() - start
+            request_latency.observe((scope["method"], path, str(status)), elapsed)
+            for phase, phase_elapsed in timings.items():
+                phase_latency.observe((path, phase), phase_elapsed)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _join(labels: str, extra: str) -> str:
+    if not labels:
+        return extra
+    return labels[:-1] + "," + extra[1:]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
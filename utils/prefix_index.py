@@ -0,0 +1,102 @@
+from ipaddress import IPv4Network, IPv6Network, ip_network
+from typing import Any, Iterable
+
+from database import canonical_ip
+
+IPNetwork = IPv4Network | IPv6Network
+
+
+class _Node:
+    __slots__ = ("children", "network", "value")
+
+    def __init__(self):
+        self.children: list[_Node | None] = [None, None]
+        self.network: IPNetwork | None = None
+        self.value: Any = None
+
+
+class PrefixIndex:
+    """In-memory longest-prefix-match index of ip networks (binary trie).
+
+    Lookup walks at most 32 (IPv4) or 128 (IPv6) nodes, so its cost does not
+    depend on the number of stored networks.
+    """
+
+    def __init__(self):
+        self._roots = {4: _Node(), 6: _Node()}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, network: IPNetwork | str, value: Any):
+        network = ip_network(network)
+        node = self._roots[network.version]
+        for bit in _prefix_bits(network):
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+        if node.network is None:
+            self._size += 1
+        node.network, node.value = network, value
+
+    def remove(self, network: IPNetwork | str) -> bool:
+        network = ip_network(network)
+        path = [self._roots[network.version]]
+        bits = _prefix_bits(network)
+        for bit in bits:
+            node = path[-1].children[bit]
+            if node is None:
+                return False
+            path.append(node)
+        if path[-1].network is None:
+            return False
+        path[-1].network = path[-1].value = None
+        self._size -= 1
+        # prune branches left without any network
+        for parent, node, bit in zip(
+            reversed(path[:-1]), reversed(path), reversed(bits)
+        ):
+            if node.network is not None or any(node.children):
+                break
+            parent.children[bit] = None
+        return True
+
+    def lookup(self, ip: str) -> tuple[IPNetwork, Any] | None:
+        """Return most specific network covering ip and its value."""
+        address = canonical_ip(ip)
+        node = self._roots[address.version]
+        found = None
+        for bit in _bits(int(address), address.max_prefixlen):
+            if node.network is not None:
+                found = node
+            node = node.children[bit]
+            if node is None:
+                break
+        else:
+            if node.network is not None:
+                found = node
+        return (found.network, found.value) if found else None
+
+    def replace(self, items: Iterable[tuple[IPNetwork | str, Any]]):
+        """Swap content for given (network, value) pairs at once."""
+        index = PrefixIndex()
+        for network, value in items:
+            index.insert(network, value)
+        self._roots, self._size = index._roots, index._size
+
+    def clear(self):
+        self._roots = {4: _Node(), 6: _Node()}
+        self._size = 0
+
+
+def _bits(value: int, length: int) -> list[int]:
+    return [(value >> shift) & 1 for shift in range(length - 1, -1, -1)]
+
+
+def _prefix_bits(network: IPNetwork) -> list[int]:
+    bits = _bits(int(network.network_address), network.max_prefixlen)
+    return bits[: network.prefixlen]
+
+
+network_index = PrefixIndex()
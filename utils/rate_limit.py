@@ -0,0 +1,124 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from settings import settings
+
+# methods served from stored data, everything else may call ipstack
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+TOO_MANY_REQUESTS = json.dumps({"message": "Too many requests"}).encode()
+
+
+class TokenBucketLimiter:
+    """Token buckets refilled at rate tokens per second, holding up to burst tokens.
+
+    Buckets are kept in least recently used order. Bucket idle long enough to
+    refill completely is the same as a new one, so it is dropped, and the
+    number of buckets is capped by max_keys. Every call is O(1).
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at)
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+
+    def acquire(self, key: Hashable, now: float | None = None) -> float:
+        """Take one token for key, return 0 or seconds to wait for the next one."""
+        if now is None:
+            now = time.monotonic()
+        self._evict_idle(now)
+
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens, updated_at = bucket
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self):
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict_idle(self, now: float):
+        # oldest buckets are first, at most two checked so the call stays O(1)
+        for _ in range(2):
+            if not self._buckets:
+                return
+            key, (tokens, updated_at) = next(iter(self._buckets.items()))
+            if tokens + (now - updated_at) * self.rate < self.burst:
+                return
+            del self._buckets[key]
+
+
+class RateLimitMiddleware:
+    """ASGI middleware limiting requests per client ip and route.
+
+    Reads and writes have separate budgets, requests over budget are answered
+    with 429 and Retry-After header before reaching the application.
+    """
+
+    def __init__(self, app, read: TokenBucketLimiter, write: TokenBucketLimiter):
+        self.app = app
+        self.read = read
+        self.write = write
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.rate_limit_enabled:
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        limiter = self.read if method in READ_METHODS else self.write
+        retry_after = limiter.acquire((_client_of(scope), method, scope["path"]))
+        if not retry_after:
+            return await self.app(scope, receive, send)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(TOO_MANY_REQUESTS)).encode()),
+                    (b"retry-after", str(math.ceil(retry_after)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": TOO_MANY_REQUESTS})
+
+
+def _client_of(scope) -> str:
+    if settings.rate_limit_trust_forwarded:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                # last address is added by our proxy, earlier ones can be forged
+                return value.decode("latin-1").split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+read_limiter = TokenBucketLimiter(
+    settings.rate_limit_read_rate,
+    settings.rate_limit_read_burst,
+    settings.rate_limit_max_clients,
+)
+write_limiter = TokenBucketLimiter(
+    settings.rate_limit_write_rate,
+    settings.rate_limit_write_burst,
+    settings.rate_limit_max_clients,
+)
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionMaker, dumps_json
+from models import GeoLocation, document_etag, utcnow
+from settings import settings
+from utils.cache import geo_cache
+from utils.locator import Locator, locator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(settings.logger_name)
+
+
+class Refresher:
+    """Background worker fetching again ipstack responses older than max_age.
+
+    Rows are walked in id order in batches, looked up through the locator at
+    no more than `rate` calls per second and updated in place, so readers
+    always see either the old or the new document. Lookups that fail leave
+    the row as it is, it is retried on the next pass.
+    With lock_path, only the worker process holding the lock file refreshes,
+    others check every interval whether they can take over.
+    """
+
+    def __init__(
+        self,
+        locator: Locator,
+        session_maker: sessionmaker,
+        max_age: float,
+        interval: float,
+        rate: float,
+        batch_size: int,
+        lock_path: str = "",
+    ):
+        self.locator = locator
+        self.session_maker = session_maker
+        self.max_age = max_age
+        self.interval = interval
+        self.rate = rate
+        self.batch_size = batch_size
+        self.lock_path = lock_path
+        self._next_call = 0.0
+        self._lock_fd: int | None = None
+
+    async def run(self):
+        """Refresh stale rows forever, sleeping interval seconds between passes."""
+        try:
+            while not self._acquire_lock():
+                await asyncio.sleep(self.interval)
+            while True:
+                try:
+                    await self.refresh_pass()
+                except Exception:
+                    logger.exception("Refreshing geo locations failed")
+                await asyncio.sleep(self.interval)
+        finally:
+            self._release_lock()
+
+    async def refresh_pass(self) -> int:
+        """Refresh every row that is stale at the start of the pass, return their count."""
+        cutoff = utcnow() - timedelta(seconds=self.max_age)
+        after, refreshed = 0, 0
+        while rows := await self._pull_stale(cutoff, after):
+            refreshed += await self._refresh(rows)
+            after = rows[-1].id
+        return refreshed
+
+    async def _pull_stale(self, cutoff, after: int) -> list:
+        query = (
+            select(
+                GeoLocation.id, GeoLocation.ip, GeoLocation.etag, GeoLocation.version
+            )
+            .where(GeoLocation.fetched_at < cutoff, GeoLocation.id > after)
+            .order_by(GeoLocation.id)
+            .limit(self.batch_size)
+        )
+        async with self.session_maker() as db:
+            return (await db.execute(query)).all()
+
+    async def _refresh(self, rows: list) -> int:
+        locations = await asyncio.gather(*[self._lookup(row.ip) for row in rows])
+        now = utcnow()
+        changed, unchanged = {}, []
+        for row, location in zip(rows, locations):
+            if not location:
+                continue
+            etag = document_etag(dumps_json(location).encode())
+            if etag == row.etag:
+                unchanged.append({"b_id": row.id, "b_version": row.version})
+                continue
+            changed[row.ip] = {
+                "b_id": row.id,
+                "b_version": row.version,
+                "ipstack_response": location,
+                "etag": etag,
+                "version": row.version + 1,
+                "updated_at": now,
+            }
+
+        # version guard skips rows changed or deleted since they were read
+        table = GeoLocation.__table__
+        guarded = update(table).where(
+            table.c.id == bindparam("b_id"), table.c.version == bindparam("b_version")
+        )
+        refreshed = 0
+        async with self.session_maker() as db:
+            for parameters in (list(changed.values()), unchanged):
+                if parameters:
+                    result = await db.execute(
+                        guarded.values(fetched_at=now), parameters
+                    )
+                    refreshed += result.rowcount
+            await db.commit()
+
+        # unchanged documents keep their etag, so only changed ones are dropped
+        for ip in changed:
+            geo_cache.invalidate(ip)
+        return refreshed
+
+    def _acquire_lock(self) -> bool:
+        if not self.lock_path or fcntl is None or self._lock_fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # released by the system when the process exits
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        logger.info("Refreshing geo locations in process %d", os.getpid())
+        self._lock_fd = fd
+        return True
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _lookup(self, ip: str) -> dict | None:
+        # calls are spaced 1 / rate apart, also across batches
+        now = time.monotonic()
+        start = max(now, self._next_call)
+        self._next_call = start + 1 / self.rate
+        await asyncio.sleep(start - now)
+        try:
+            return await self.locator.get_location_for(ip)
+        except Exception:
+            logger.warning("Refreshing %s failed", ip, exc_info=True)
+            return None
+
+
+refresher = Refresher(
+    locator,
+    SessionMaker,
+    max_age=settings.refresh_max_age,
+    interval=settings.refresh_interval,
+    rate=settings.refresh_rate,
+    batch_size=settings.refresh_batch_size,
+    lock_path=settings.refresh_lock_path,
+)
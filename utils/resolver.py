@@ -0,0 +1,123 @@
+import asyncio
+import socket
+import time
+
+from database import canonical_ip
+from settings import settings
+
+# c-ares binding imported on the first query, None when it is not installed
+aiodns = False
+
+
+def _import_aiodns():
+    global aiodns
+    if aiodns is False:
+        try:
+            import aiodns as module
+        except ImportError:
+            module = None
+        aiodns = module
+    return aiodns
+
+
+class Resolver:
+    """Asynchronous hostname resolver with positive and negative caching.
+
+    Queries go through c-ares (aiodns) when it is installed and through the
+    event loop's getaddrinfo otherwise, so no Starlette threadpool slot is
+    taken. Concurrent lookups of the same hostname share one query.
+    """
+
+    def __init__(
+        self,
+        ipv6: bool,
+        default_ttl: float,
+        max_ttl: float,
+        negative_ttl: float,
+        max_entries: int,
+    ):
+        self.ipv6 = ipv6
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # hostname -> (expires_at, ip or None for negative entries)
+        self._cache: dict[str, tuple[float, str | None]] = {}
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._dns = None
+        self._dns_loop = None
+
+    async def resolve(self, hostname: str) -> str | None:
+        hostname = hostname.lower()
+        entry = self._cache.get(hostname)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        lookup = self._in_flight.get(hostname)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._lookup(hostname))
+            self._in_flight[hostname] = lookup
+            lookup.add_done_callback(lambda _: self._in_flight.pop(hostname, None))
+        # shielded, so a cancelled caller does not cancel lookup shared with others
+        return await asyncio.shield(lookup)
+
+    def clear(self):
+        self._cache.clear()
+
+    async def _lookup(self, hostname: str) -> str | None:
+        try:
+            addresses, ttl = await self._query(hostname)
+        except socket.gaierror:
+            addresses, ttl = [], self.negative_ttl
+        ip = addresses[0] if addresses else None
+        if ip is None:
+            ttl = self.negative_ttl
+        self._store(hostname, ip, ttl)
+        return ip
+
+    async def _query(self, hostname: str) -> tuple[list[str], float]:
+        """Return addresses (IPv4 first) and TTL, raise gaierror if not found."""
+        family = socket.AF_UNSPEC if self.ipv6 else socket.AF_INET
+        if _import_aiodns() is not None:
+            try:
+                result = await self._get_dns().getaddrinfo(hostname, family=family)
+            except aiodns.error.DNSError as exc:
+                raise socket.gaierror(*exc.args) from exc
+            nodes = [
+                (node.family, node.addr[0].decode(), node.ttl) for node in result.nodes
+            ]
+        else:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                hostname, None, family=family, type=socket.SOCK_STREAM
+            )
+            nodes = [(info[0], info[4][0], 0) for info in infos]
+
+        nodes.sort(key=lambda node: node[0] != socket.AF_INET)
+        addresses = list(dict.fromkeys(str(canonical_ip(node[1])) for node in nodes))
+        # getaddrinfo reports no ttl (and /etc/hosts entries have 0)
+        ttls = [node[2] for node in nodes if node[2] > 0]
+        return addresses, min(ttls) if ttls else self.default_ttl
+
+    def _get_dns(self):
+        # c-ares channel is bound to the loop it was created in
+        loop = asyncio.get_running_loop()
+        if self._dns is None or self._dns_loop is not loop:
+            self._dns = aiodns.DNSResolver(loop=loop)
+            self._dns_loop = loop
+        return self._dns
+
+    def _store(self, hostname: str, ip: str | None, ttl: float):
+        if self.max_entries <= 0:
+            return
+        if hostname not in self._cache and len(self._cache) >= self.max_entries:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[hostname] = (time.monotonic() + min(ttl, self.max_ttl), ip)
+
+
+resolver = Resolver(
+    ipv6=settings.dns_ipv6,
+    default_ttl=settings.dns_default_ttl,
+    max_ttl=settings.dns_max_ttl,
+    negative_ttl=settings.dns_negative_ttl,
+    max_entries=settings.dns_cache_max_entries,
+)
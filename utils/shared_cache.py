@@ -0,0 +1,243 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Iterable
+
+from database import pack_ip
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b"GEOSHM01"
+# magic, slots, slot size
+FILE_HEADER = struct.Struct("<8sII")
+FILE_HEADER_SIZE = 64
+# sequence number of seqlock, odd while slot is written
+SEQUENCE = struct.Struct("<I")
+# key length (0 for empty slot), packed ip, expires at and modified at
+# (unix time, 0 for unknown), etag digest, payload length
+SLOT_HEADER = struct.Struct("<B16sdd16sI")
+SLOT_HEADER_SIZE = 64
+# slots probed for a key, so colliding keys do not evict each other at once
+WAYS = 4
+LOCK_STRIPES = 64
+
+
+# payload, etag and modified at, fields of GeoDocument
+Entry = tuple[bytes, str, datetime | None]
+
+
+class SharedGeoCache:
+    """Cache of serialized ipstack responses shared by worker processes of one host.
+
+    Fixed-capacity hash table in a memory-mapped file: every ip hashes to a
+    bucket of WAYS slots of slot_size bytes, documents not fitting into a slot
+    are not cached. Readers take no lock, slots are versioned with a seqlock
+    and reads racing with a write are retried or reported as misses. Writers
+    of one bucket are serialized by striped fcntl locks.
+    """
+
+    def __init__(self, path: str, slots: int, slot_size: int, ttl: float):
+        if fcntl is None:
+            raise RuntimeError("Shared cache needs fcntl, available on unix only")
+        self.path = path
+        self.buckets = max(1, slots // WAYS)
+        self.slots = self.buckets * WAYS
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT_HEADER_SIZE
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        size = FILE_HEADER_SIZE + self.slots * slot_size
+        self._fd = self._open(FILE_HEADER.pack(MAGIC, self.slots, slot_size), size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def get(self, ip: str) -> Entry | None:
+        key = pack_ip(ip)
+        for offset in self._bucket_offsets(key):
+            found, entry = self._read(offset, key)
+            if found:
+                if entry is None:
+                    break
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, ip: str, payload: bytes, etag: str, modified_at: datetime | None):
+        key = pack_ip(ip)
+        if len(payload) > self.capacity or len(etag) != 32:
+            self.invalidate(ip)
+            return
+        header = SLOT_HEADER.pack(
+            len(key),
+            key,
+            time.time() + self.ttl,
+            modified_at.replace(tzinfo=timezone.utc).timestamp() if modified_at else 0,
+            bytes.fromhex(etag),
+            len(payload),
+        )
+        with self._locked(key):
+            offset = self._slot_for_write(key)
+            self._write(offset, header, payload)
+
+    def invalidate(self, ip: str):
+        key = pack_ip(ip)
+        with self._locked(key):
+            self._clear_key(key)
+
+    def invalidate_many(self, ips: Iterable[str]):
+        # keys grouped by lock stripe, every stripe is locked once
+        stripes: dict[int, list[bytes]] = {}
+        for ip in ips:
+            key = pack_ip(ip)
+            stripes.setdefault(self._stripe_of(key), []).append(key)
+        for stripe, keys in stripes.items():
+            with _StripeLock(self._fd, stripe):
+                for key in keys:
+                    self._clear_key(key)
+
+    def clear(self):
+        for slot in range(self.slots):
+            offset = FILE_HEADER_SIZE + slot * self.slot_size
+            self._write(offset, SLOT_HEADER.pack(0, b"", 0, 0, b"", 0), b"")
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        return {"slots": self.slots, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _open(self, header: bytes, size: int) -> int:
+        """Open file with given header, replacing missing or different one.
+
+        File is never truncated in place: workers still mapping a file of
+        other geometry (rolling restart) keep it, instead of getting SIGBUS.
+        """
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            # header, including bytes locked by writers, is locked while
+            # the first worker replaces the file
+            fcntl.lockf(fd, fcntl.LOCK_EX, FILE_HEADER_SIZE, 0)
+            try:
+                # file may be replaced by another worker while waiting for the lock
+                replaced = os.fstat(fd).st_ino != os.stat(self.path).st_ino
+                if not replaced and os.pread(fd, FILE_HEADER.size, 0) == header:
+                    return fd
+                if not replaced:
+                    self._replace(header, size)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, FILE_HEADER_SIZE, 0)
+            os.close(fd)
+
+    def _replace(self, header: bytes, size: int):
+        temporary = f"{self.path}.{os.getpid()}"
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            os.pwrite(fd, header, 0)
+        finally:
+            os.close(fd)
+        os.replace(temporary, self.path)
+
+    def _read(self, offset: int, key: bytes) -> tuple[bool, Entry | None]:
+        """Return whether slot holds key and its entry, None when expired."""
+        for _ in range(3):
+            (sequence,) = SEQUENCE.unpack_from(self._map, offset)
+            if sequence & 1:
+                continue
+            length, stored, expires_at, modified_at, etag, size = (
+                SLOT_HEADER.unpack_from(self._map, offset + SEQUENCE.size)
+            )
+            if stored[:length] != key or length != len(key) or size > self.capacity:
+                payload = None
+            else:
+                start = offset + SLOT_HEADER_SIZE
+                payload = self._map[start : start + size]
+            if SEQUENCE.unpack_from(self._map, offset)[0] != sequence:
+                continue
+            if payload is None:
+                return False, None
+            if expires_at <= time.time():
+                return True, None
+            if modified_at:
+                modified = datetime.fromtimestamp(modified_at, timezone.utc)
+                modified = modified.replace(tzinfo=None)
+            else:
+                modified = None
+            return True, (payload, etag.hex(), modified)
+        # slot kept changing, reported as miss
+        return False, None
+
+    def _write(self, offset: int, header: bytes, payload: bytes):
+        (sequence,) = SEQUENCE.unpack_from(self._map, offset)
+        # odd while written, also when previous writer died in the middle
+        sequence = (sequence + 1 | 1) & 0xFFFFFFFF
+        SEQUENCE.pack_into(self._map, offset, sequence)
+        start = offset + SEQUENCE.size
+        self._map[start : start + len(header)] = header
+        start = offset + SLOT_HEADER_SIZE
+        self._map[start : start + len(payload)] = payload
+        SEQUENCE.pack_into(self._map, offset, (sequence + 1) & 0xFFFFFFFF)
+
+    def _slot_for_write(self, key: bytes) -> int:
+        # slot of the same key, else empty or expired one, else the oldest
+        now = time.time()
+        candidate, candidate_expires = None, None
+        for offset in self._bucket_offsets(key):
+            length, stored, expires_at, *_ = SLOT_HEADER.unpack_from(
+                self._map, offset + SEQUENCE.size
+            )
+            if length and stored[:length] == key:
+                return offset
+            if not length or expires_at <= now:
+                expires_at = 0.0
+            if candidate is None or expires_at < candidate_expires:
+                candidate, candidate_expires = offset, expires_at
+        return candidate
+
+    def _clear_key(self, key: bytes):
+        for offset in self._bucket_offsets(key):
+            if self._key_at(offset) == key:
+                self._write(offset, SLOT_HEADER.pack(0, b"", 0, 0, b"", 0), b"")
+
+    def _key_at(self, offset: int) -> bytes:
+        length, stored, *_ = SLOT_HEADER.unpack_from(self._map, offset + SEQUENCE.size)
+        return stored[:length]
+
+    def _bucket_offsets(self, key: bytes) -> range:
+        # crc32 is the same in every process, unlike hash()
+        first = zlib.crc32(key) % self.buckets * WAYS
+        start = FILE_HEADER_SIZE + first * self.slot_size
+        return range(start, start + WAYS * self.slot_size, self.slot_size)
+
+    def _locked(self, key: bytes) -> "_StripeLock":
+        return _StripeLock(self._fd, self._stripe_of(key))
+
+    def _stripe_of(self, key: bytes) -> int:
+        return zlib.crc32(key) % self.buckets % LOCK_STRIPES
+
+
+class _StripeLock:
+    """Exclusive fcntl lock of one of the last LOCK_STRIPES bytes of the file header."""
+
+    def __init__(self, fd: int, stripe: int):
+        self.fd = fd
+        self.stripe = stripe
+
+    def __enter__(self):
+        fcntl.lockf(
+            self.fd, fcntl.LOCK_EX, 1, FILE_HEADER_SIZE - LOCK_STRIPES + self.stripe
+        )
+
+    def __exit__(self, *_):
+        fcntl.lockf(
+            self.fd, fcntl.LOCK_UN, 1, FILE_HEADER_SIZE - LOCK_STRIPES + self.stripe
+        )
@@ -0,0 +1,30 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller runs the coroutine, callers arriving while it is still in
+    flight await its outcome (result or exception) instead of running their own.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Return result of the call for key and whether it was shared.
+
+        Shared means the caller joined a call started by another one.
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            return await asyncio.shield(call), True
+
+        call = asyncio.ensure_future(fn())
+        self._calls[key] = call
+        call.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shielded, so followers still get the outcome if the leader is cancelled
+        return await asyncio.shield(call), False
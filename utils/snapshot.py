@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime, timezone
+
+from sqlalchemy import Connection
+
+from database import pack_ip
+from settings import settings
+from storage_codec import storage_codec
+from utils.cache import GeoDocument
+
+logger = logging.getLogger(settings.logger_name)
+
+MAGIC = b"GEOSNAP1"
+# magic, ipv4 and ipv6 record counts, offsets of both indexes and of payloads
+HEADER = struct.Struct("<8sIIQQQ")
+# packed ip, payload offset and length, etag digest, modified at (unix time)
+RECORDS = {4: struct.Struct("<4sQI16sd"), 16: struct.Struct("<16sQI16sd")}
+# rows written to the file at once while building
+BUILD_CHUNK = 10_000
+
+
+class Snapshot:
+    """Immutable geo location snapshot file, read through read-only mmap.
+
+    File holds header, index of fixed-size records for IPv4 and for IPv6
+    addresses, each sorted by packed ip, and section of payloads they point
+    to. Lookup is binary search over the index, payload is returned as
+    memoryview of the mapping, without copying it.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, v4_count, v6_count, v4_index, v6_index, _ = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a geo location snapshot")
+        self._indexes = {4: (v4_index, v4_count), 16: (v6_index, v6_count)}
+        self._view = memoryview(self._map)
+
+    def __len__(self) -> int:
+        return sum(count for _, count in self._indexes.values())
+
+    def get(self, ip: str) -> GeoDocument | None:
+        key = pack_ip(ip)
+        record = RECORDS[len(key)]
+        start, count = self._indexes[len(key)]
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            position = start + middle * record.size
+            probe = self._map[position : position + len(key)]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                _, offset, size, etag, modified_at = record.unpack_from(
+                    self._map, position
+                )
+                modified = datetime.fromtimestamp(modified_at, timezone.utc)
+                return GeoDocument(
+                    self._view[offset : offset + size],
+                    etag.hex(),
+                    modified.replace(tzinfo=None),
+                )
+        return None
+
+
+class SnapshotStore:
+    """Holds current snapshot of a path, replaced when the file changes.
+
+    New snapshot has to be published by renaming complete file over the path
+    (never written in place, which would change mapped pages), so a reader
+    always gets either the old or the new one. Replaced mapping is
+    released when the last payload taken from it is gone.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.current: Snapshot | None = None
+        self._identity = None
+
+    def get(self, ip: str) -> GeoDocument | None:
+        snapshot = self.current
+        return snapshot.get(ip) if snapshot is not None else None
+
+    def reload(self) -> bool:
+        """Open the file again when it was replaced, return whether it was."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return False
+        # invalid file is reported once, current snapshot is kept
+        self._identity = identity
+        try:
+            snapshot = Snapshot(self.path)
+        except (OSError, ValueError):
+            logger.warning("Could not open snapshot %s", self.path, exc_info=True)
+            return False
+        self.current = snapshot
+        logger.info("Loaded snapshot %s with %d locations", self.path, len(snapshot))
+        return True
+
+    async def watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.reload()
+
+
+def build_snapshot(connection: Connection, path: str) -> int:
+    """Write every geo location to snapshot file at path, return their count.
+
+    File is written next to path and renamed over it when complete.
+    """
+    # one read transaction, so counts match the rows written
+    with connection.begin():
+        counts = dict(
+            connection.exec_driver_sql(
+                "SELECT family, count(*) FROM geo_location GROUP BY family"
+            ).all()
+        )
+        v4_index = HEADER.size
+        v6_index = v4_index + counts.get(4, 0) * RECORDS[4].size
+        payloads = v6_index + counts.get(6, 0) * RECORDS[16].size
+
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as file:
+            header = HEADER.pack(
+                MAGIC, counts.get(4, 0), counts.get(6, 0), v4_index, v6_index, payloads
+            )
+            file.write(header)
+            index_position, payload_position = v4_index, payloads
+            for family in (4, 6):
+                # ip index yields rows sorted by packed ip
+                rows = connection.exec_driver_sql(
+                    "SELECT ip, ipstack_response, etag, updated_at FROM geo_location "
+                    "WHERE family = ? ORDER BY ip",
+                    (family,),
+                )
+                while chunk := rows.fetchmany(BUILD_CHUNK):
+                    index, data = bytearray(), bytearray()
+                    for ip, document, etag, updated_at in chunk:
+                        payload = storage_codec.decode(document)
+                        modified_at = datetime.fromisoformat(updated_at)
+                        index += RECORDS[len(ip)].pack(
+                            ip,
+                            payload_position + len(data),
+                            len(payload),
+                            bytes.fromhex(etag),
+                            modified_at.replace(tzinfo=timezone.utc).timestamp(),
+                        )
+                        data += payload
+                    os.pwrite(file.fileno(), index, index_position)
+                    os.pwrite(file.fileno(), data, payload_position)
+                    index_position += len(index)
+                    payload_position += len(data)
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return sum(counts.values())
+
+
+snapshot_store = SnapshotStore(settings.snapshot_path)
@@ -0,0 +1,62 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from settings import settings
+from utils.metrics import Gauge, registry
+
+logger = logging.getLogger(settings.logger_name)
+
+
+def process_started_at() -> float:
+    """Return perf_counter() time of process start, or of now where it is unknown."""
+    now = time.perf_counter()
+    try:
+        with open("/proc/self/stat") as file:
+            # fields after the parenthesized command name, starttime is the 20th
+            start_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return now
+    return now - max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+class Startup:
+    """Durations of startup phases, from process start (with imports) to readiness."""
+
+    def __init__(self):
+        self.started_at = process_started_at()
+        self.phases: dict[str, float] = {}
+        self.seconds: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.seconds is not None
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def done(self):
+        self.seconds = time.perf_counter() - self.started_at
+        phases = ", ".join(
+            f"{name} {value:.3f}s" for name, value in self.phases.items()
+        )
+        logger.info("Started in %.3fs (%s)", self.seconds, phases)
+
+
+startup = Startup()
+
+registry.register(
+    Gauge(
+        "app_startup_seconds",
+        "Time from process start to readiness.",
+        lambda: startup.seconds,
+    )
+)